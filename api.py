@@ -1,13 +1,30 @@
-from typing import List
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from pydantic import BaseModel
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
+import config
+from models.async_lookup import close_async_client
+from models.http_archive import install_http_archive
+from models.metrics import metrics
+from models.spacy_model_registry import spacy_models
 from models.srt_sentence import SrtSentence
+from models.srt_sentence_batch import SrtSentenceBatch
 from models.token_response import TokenResponse
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    install_http_archive()
+    spacy_models.preload(spacy_models=config.preload_spacy_models)
+    yield
+    await close_async_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class SentenceRequest(BaseModel):
@@ -15,6 +32,11 @@ class SentenceRequest(BaseModel):
     spacy_model: str
 
 
+class SentencesRequest(BaseModel):
+    sentences: List[str]
+    spacy_model: str
+
+
 class ResponseList(BaseModel):
     data: List[TokenResponse]
 
@@ -25,7 +47,7 @@ async def process_sentence(sentence_request: SentenceRequest):
         srt_sentence = SrtSentence(
             sentence=sentence_request.sentence, spacy_model=sentence_request.spacy_model
         )
-        srt_sentence.clean_get_tokens_and_extract_forms()
+        await srt_sentence.clean_get_tokens_and_extract_forms_async()
         if srt_sentence.number_of_tokens:
             return JSONResponse(
                 content=ResponseList(data=srt_sentence.get_token_responses).model_dump()
@@ -34,5 +56,67 @@ async def process_sentence(sentence_request: SentenceRequest):
             raise HTTPException(
                 status_code=400, detail="Error: No tokens found by spaCy"
             )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def stream_batch(batch: SrtSentenceBatch) -> StreamingResponse:
+    """Load the model and produce the first window before the response
+    starts so those errors still get a proper status code"""
+    try:
+        await asyncio.to_thread(spacy_models.get, spacy_model=batch.spacy_model)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ndjson = batch.stream_ndjson()
+    first_lines: List[str] = []
+    try:
+        first_lines.append(await anext(ndjson))
+    except StopAsyncIteration:
+        pass
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    async def body() -> AsyncIterator[str]:
+        for line in first_lines:
+            yield line
+        async for line in ndjson:
+            yield line
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.post("/process_sentences")
+async def process_sentences(sentences_request: SentencesRequest):
+    """Stream one JSON line per sentence in the order they were sent"""
+    batch = SrtSentenceBatch(
+        sentences=sentences_request.sentences,
+        spacy_model=sentences_request.spacy_model,
+    )
+    return await stream_batch(batch)
+
+
+@app.post("/process_srt")
+async def process_srt(
+    file: UploadFile = File(...),
+    spacy_model: str = Form(...),
+    encoding: str = Form("utf-8"),
+):
+    """Stream one JSON line per cue of the uploaded SRT file in cue order"""
+    try:
+        srt_content = (await file.read()).decode(encoding)
+        batch = SrtSentenceBatch.from_srt(
+            srt_content=srt_content, spacy_model=spacy_model
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await stream_batch(batch)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Counters and histograms in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
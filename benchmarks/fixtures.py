@@ -0,0 +1,77 @@
+"""Deterministic synthetic SRT fixtures for the benchmarks
+
+The files are generated on first use into benchmarks/fixtures and look
+like real subtitles: dialog hyphens, some italic markup, one or two lines
+per cue, a credits cue and a commercial at the end. 10k cues is about
+the size of a whole season. The words of every language are in
+words.json."""
+import json
+import os
+import random
+from datetime import timedelta
+from typing import Dict, List
+
+from srt import Subtitle, compose  # type: ignore
+
+FIXTURE_DIRECTORY = os.path.join(os.path.dirname(__file__), "fixtures")
+FIXTURE_SIZES = [100, 1000, 10000]
+
+# kept out of the Python files so codespell does not check the foreign words
+WORDS_PATH = os.path.join(os.path.dirname(__file__), "words.json")
+with open(WORDS_PATH, encoding="utf-8") as words_file:
+    WORDS: Dict[str, List[str]] = json.load(words_file)
+LANGUAGES = list(WORDS)
+
+CREDITS = {
+    "en": "Subtitles by LexSrt benchmarks",
+    "sv": "Subtitles av LexSrt benchmarks",
+    "da": "Subtitles af LexSrt benchmarks",
+    "de": "Subtitles von LexSrt benchmarks",
+}
+
+
+def generate_line(generator: random.Random, words: List[str]) -> str:
+    line = " ".join(generator.choice(words) for _ in range(generator.randint(2, 9)))
+    line = line[0].upper() + line[1:] + generator.choice([".", "?", "!", "..."])
+    if generator.random() < 0.1:
+        line = f"<i>{line}</i>"
+    return line
+
+
+def generate_subtitles(language: str, number_of_cues: int) -> List[Subtitle]:
+    generator = random.Random(f"{language}-{number_of_cues}")
+    words = WORDS[language]
+    subtitles = []
+    start = timedelta(seconds=1)
+    for index in range(1, number_of_cues + 1):
+        if generator.random() < 0.2:
+            content = (
+                f"- {generate_line(generator, words)}\n"
+                f"- {generate_line(generator, words)}"
+            )
+        else:
+            content = "\n".join(
+                generate_line(generator, words) for _ in range(generator.randint(1, 2))
+            )
+        if index == number_of_cues - 1:
+            content = CREDITS[language]
+        elif index == number_of_cues:
+            content = "Advertise your product or brand here"
+        end = start + timedelta(milliseconds=generator.randint(800, 4000))
+        subtitles.append(Subtitle(index=index, start=start, end=end, content=content))
+        start = end + timedelta(milliseconds=generator.randint(100, 2000))
+    return subtitles
+
+
+def get_fixture(language: str, number_of_cues: int) -> str:
+    """Path to the fixture, it is generated if it does not exist yet"""
+    filename = os.path.join(FIXTURE_DIRECTORY, f"{language}_{number_of_cues}.srt")
+    if not os.path.exists(filename):
+        os.makedirs(FIXTURE_DIRECTORY, exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write(
+                compose(
+                    generate_subtitles(language=language, number_of_cues=number_of_cues)
+                )
+            )
+    return filename
@@ -0,0 +1,189 @@
+"""Benchmark the stages of the CLI pipeline against the local stand-in
+
+Run from the repository root, no network access is needed:
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --sizes 100 1000 --languages en sv --latency 0.05
+
+For every fixture the time, the peak traced memory and the number of
+requests to the stand-in are reported per stage. The output printed by
+the stages themselves is suppressed. The match cache, the token cache
+and the lexeme store are disabled so every run starts cold. Models that are not
+installed are replaced by a blank pipeline, which has no PoS tagger so
+all tokens go through the noun, verb and adjective cascade."""
+import gc
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, List
+
+import spacy
+from wikibaseintegrator.wbi_config import config as wbi_config  # type: ignore
+
+import config
+from benchmarks.fixtures import FIXTURE_SIZES, LANGUAGES, get_fixture
+from benchmarks.stand_in import StandInServer
+from models import LexSrt
+from models.from_ordia import iso639_to_q
+from models.spacy_model_registry import spacy_models
+
+logger = logging.getLogger(__name__)
+
+SPACY_MODELS = {
+    "en": "en_core_web_sm",
+    "sv": "sv_core_news_sm",
+    "da": "da_core_news_sm",
+    "de": "de_core_news_sm",
+}
+
+
+def get_spacy_model(language: str) -> str:
+    spacy_model = SPACY_MODELS.get(language, "")
+    if spacy_model and spacy.util.is_package(spacy_model):
+        return spacy_model
+    return f"blank:{language}"
+
+
+def measure(
+    server: StandInServer, name: str, function: Callable[[], Any], trace_memory: bool
+) -> Dict[str, Any]:
+    gc.collect()
+    server.reset_counters()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        function()
+    seconds = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "stage": name,
+        "seconds": round(seconds, 4),
+        "peak_mb": round(peak / 2**20, 2),
+        "requests": dict(server.requests),
+        "bytes": server.bytes_sent,
+    }
+
+
+def benchmark_fixture(
+    server: StandInServer, language: str, size: int, trace_memory: bool
+) -> Dict[str, Any]:
+    iso639_to_q.cache_clear()
+    with tempfile.TemporaryDirectory() as output_directory:
+        lexsrt = LexSrt(
+            filename=get_fixture(language=language, number_of_cues=size),
+            language_code=language,
+            spacy_model=get_spacy_model(language),
+            output_directory=output_directory,
+        )
+        # load the model outside of the measurements
+        spacy_models.get(spacy_model=lexsrt.spacy_model)
+
+        def parse_srt():
+            lexsrt.read_srt_file()
+            lexsrt.get_srt_content_and_remove_commercial()
+
+        def export():
+            lexsrt.create_lexeme_dataframe()
+            lexsrt.create_match_error_dataframe()
+            lexsrt.write_reports()
+
+        stages = [
+            ("parse", parse_srt),
+            ("get_spacy_tokens", lexsrt.get_spacy_tokens),
+            ("extract_lexemes_based_on_tokens", lexsrt.extract_lexemes_based_on_tokens),
+            ("get_unique_wbi_lexemes", lexsrt.get_unique_wbi_lexemes),
+            ("export", export),
+        ]
+        results = [
+            measure(server, name, function, trace_memory) for name, function in stages
+        ]
+    return {
+        "language": language,
+        "cues": size,
+        "spacy_model": lexsrt.spacy_model,
+        "tokens": lexsrt.number_of_tokens_found,
+        "lexemes": len(lexsrt.unique_wbi_lexemes),
+        "stages": results,
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(
+        f"{'fixture':<12}{'stage':<34}{'seconds':>10}{'peak MB':>10}"
+        f"{'queries':>9}{'api':>6}"
+    )
+    for result in results:
+        fixture = f"{result['language']}_{result['cues']}"
+        for stage in result["stages"]:
+            queries = stage["requests"].get("sparql", 0)
+            api_calls = sum(
+                count
+                for kind, count in stage["requests"].items()
+                if kind.startswith("api")
+            )
+            print(
+                f"{fixture:<12}{stage['stage']:<34}{stage['seconds']:>10.3f}"
+                f"{stage['peak_mb']:>10.2f}{queries:>9}{api_calls:>6}"
+            )
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the LexSrt pipeline offline")
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=FIXTURE_SIZES, help="Number of cues"
+    )
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, choices=LANGUAGES)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stand-in waits before answering each request",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Do not trace memory, tracemalloc slows down the stages",
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    # the match errors of the unmatched tokens are expected
+    logging.basicConfig(level=logging.CRITICAL)
+
+    config.match_cache_path = ""
+    config.token_cache_path = ""
+    config.lexeme_store_path = ""
+    config.lexeme_index_path = ""
+    server = StandInServer(latency=args.latency).start()
+    wbi_config["SPARQL_ENDPOINT_URL"] = server.sparql_endpoint_url
+    wbi_config["MEDIAWIKI_API_URL"] = server.mediawiki_api_url
+    results = []
+    try:
+        for language in args.languages:
+            for size in args.sizes:
+                results.append(
+                    benchmark_fixture(
+                        server=server,
+                        language=language,
+                        size=size,
+                        trace_memory=not args.no_memory,
+                    )
+                )
+    finally:
+        server.stop()
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
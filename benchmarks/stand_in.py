@@ -0,0 +1,233 @@
+"""Local HTTP stand-in for WDQS and the Wikibase API
+
+Serves canned but deterministic answers for the queries LexSrt sends so
+the benchmarks run without network access. Whether a (representation,
+lexical category) pair matches is decided by a hash so repeated runs
+give the same results. Every request waits the configured latency
+first, which makes the number of round trips visible in the timings."""
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+ENTITY_PREFIX = "http://www.wikidata.org/entity/"
+LANGUAGES = {"en": "Q1860", "sv": "Q9027", "da": "Q9035", "de": "Q188"}
+LEMMA_LANGUAGES = list(LANGUAGES)
+
+BATCH_PAIR_PATTERN = re.compile(r'\("((?:[^"\\]|\\.)*)"@([\w-]+) wd:(Q\d+)\)')
+REPRESENTATION_PATTERN = re.compile(
+    r'ontolex:representation "((?:[^"\\]|\\.)*)"@([\w-]+)'
+)
+VALUES_CATEGORIES_PATTERN = re.compile(r"VALUES \?lexical_category \{([^}]*)\}")
+CATEGORY_PATTERN = re.compile(r"wikibase:lexicalCategory / wdt:P279\* wd:(Q\d+)")
+ISO639_PATTERN = re.compile(r'wdt:P21[89] "([\w-]+)"')
+
+
+def unescape(representation: str) -> str:
+    return representation.replace('\\"', '"').replace("\\\\", "\\")
+
+
+def lexeme_number(representation: str, lexical_category: str) -> Optional[int]:
+    """The lexeme matching the pair or None, about two thirds match"""
+    checksum = zlib.crc32(f"{representation}|{lexical_category}".encode())
+    if checksum % 3 == 0:
+        return None
+    return checksum % 50_000 + 1
+
+
+def form_binding(
+    representation: str, iso639: str, lexical_category: str
+) -> Optional[Dict[str, Any]]:
+    number = lexeme_number(representation, lexical_category)
+    if number is None:
+        return None
+    return {
+        "representation": {
+            "type": "literal",
+            "value": representation,
+            "xml:lang": iso639,
+        },
+        "lexical_category": {"type": "uri", "value": ENTITY_PREFIX + lexical_category},
+        "form": {"type": "uri", "value": f"{ENTITY_PREFIX}L{number}-F1"},
+    }
+
+
+def answer_sparql(query: str) -> Dict[str, Any]:
+    bindings: List[Dict[str, Any]] = []
+    iso639_match = ISO639_PATTERN.search(query)
+    if iso639_match and "ontolex" not in query:
+        language = LANGUAGES.get(iso639_match.group(1))
+        if language:
+            bindings.append(
+                {"code": {"type": "uri", "value": ENTITY_PREFIX + language}}
+            )
+        return {"results": {"bindings": bindings}}
+    pairs: List[Tuple[str, str, str]] = [
+        (unescape(representation), iso639, lexical_category)
+        for representation, iso639, lexical_category in BATCH_PAIR_PATTERN.findall(
+            query
+        )
+    ]
+    representation_match = REPRESENTATION_PATTERN.search(query)
+    if not pairs and representation_match:
+        representation = unescape(representation_match.group(1))
+        iso639 = representation_match.group(2)
+        values_match = VALUES_CATEGORIES_PATTERN.search(query)
+        if values_match:
+            lexical_categories = re.findall(r"wd:(Q\d+)", values_match.group(1))
+        else:
+            lexical_categories = CATEGORY_PATTERN.findall(query)
+        pairs = [
+            (representation, iso639, lexical_category)
+            for lexical_category in lexical_categories
+        ]
+    for representation, iso639, lexical_category in pairs:
+        binding = form_binding(representation, iso639, lexical_category)
+        if binding:
+            bindings.append(binding)
+    return {"results": {"bindings": bindings}}
+
+
+def lexeme_json(lexeme_id: str) -> Dict[str, Any]:
+    number = int(lexeme_id[1:])
+    senses = []
+    if number % 4:
+        senses.append(
+            {
+                "id": f"{lexeme_id}-S1",
+                "glosses": {
+                    language: {"language": language, "value": f"gloss of {lexeme_id}"}
+                    for language in LEMMA_LANGUAGES
+                },
+                "claims": {},
+            }
+        )
+    return {
+        "type": "lexeme",
+        "id": lexeme_id,
+        "lastrevid": 1000 + number,
+        "lemmas": {
+            language: {"language": language, "value": f"lemma-{lexeme_id}"}
+            for language in LEMMA_LANGUAGES
+        },
+        "lexicalCategory": "Q1084",
+        "language": "Q1860",
+        "claims": {},
+        "forms": [],
+        "senses": senses,
+    }
+
+
+def answer_api(parameters: Dict[str, str]) -> Dict[str, Any]:
+    action = parameters.get("action")
+    if action == "wbgetentities":
+        return {
+            "entities": {
+                lexeme_id: lexeme_json(lexeme_id)
+                for lexeme_id in parameters.get("ids", "").split("|")
+                if lexeme_id
+            },
+            "success": 1,
+        }
+    if action == "query" and parameters.get("prop") == "info":
+        pages = {}
+        for number, title in enumerate(parameters.get("titles", "").split("|")):
+            lexeme_id = title.split(":", 1)[-1]
+            pages[str(number)] = {
+                "title": title,
+                "lastrevid": lexeme_json(lexeme_id)["lastrevid"],
+            }
+        return {"query": {"pages": pages}}
+    return {"error": {"code": "badvalue", "info": f"Unsupported action {action}"}}
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def sparql_endpoint_url(self) -> str:
+        return f"{self.base_url}/sparql"
+
+    @property
+    def mediawiki_api_url(self) -> str:
+        return f"{self.base_url}/w/api.php"
+
+    def start(self) -> "StandInServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logger.info(f"Stand-in listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def __parameters__(self) -> Dict[str, str]:
+        parameters = parse_qs(urlparse(self.path).query)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if "multipart/form-data" not in self.headers.get("Content-Type", ""):
+                parameters.update(parse_qs(body))
+        return {key: values[-1] for key, values in parameters.items()}
+
+    def __respond__(self):
+        path = urlparse(self.path).path
+        parameters = self.__parameters__()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if path == "/sparql":
+            kind = "sparql"
+            answer = answer_sparql(parameters.get("query", ""))
+        elif path == "/w/api.php":
+            kind = f"api {parameters.get('action')}"
+            answer = answer_api(parameters)
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(answer).encode()
+        with self.server.lock:
+            self.server.requests[kind] += 1
+            self.server.bytes_sent += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.__respond__()
+
+    def do_POST(self):
+        self.__respond__()
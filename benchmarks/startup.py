@@ -0,0 +1,95 @@
+"""Benchmark how long it takes to start the CLI and the API
+
+Run from the repository root:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10
+
+Every scenario runs in a fresh interpreter so nothing is cached in
+sys.modules. The median wall time over the repetitions is reported
+together with the heavy packages the scenario ended up importing."""
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+HEAVY_PACKAGES = [
+    "spacy",
+    "pandas",
+    "wikibaseintegrator",
+    "bs4",
+    "email_validator",
+    "httpx",
+    "requests",
+    "fastapi",
+]
+# Python source run by a fresh interpreter for every scenario
+SCENARIOS = {
+    "cli --help": "import runpy, sys; sys.argv = ['cli.py', '--help']; "
+    "runpy.run_path('cli.py', run_name='__main__')",
+    "import models": "import models",
+    "import LexSrt": "from models import LexSrt",
+    "import SrtSentence": "from models.srt_sentence import SrtSentence",
+    "import api": "import api",
+}
+# reports the heavy packages in sys.modules when the interpreter exits
+REPORT_IMPORTS = (
+    "import atexit, sys; atexit.register(lambda: sys.stderr.write('IMPORTED ' + "
+    "','.join(p for p in {packages!r} if p in sys.modules) + '\\n'))\n"
+)
+
+
+def run_scenario(source: str, repeat: int) -> Dict[str, Any]:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", source], capture_output=True)
+        seconds.append(time.perf_counter() - start)
+    # one extra run that is not timed reports what was imported
+    result = subprocess.run(
+        [sys.executable, "-c", REPORT_IMPORTS.format(packages=HEAVY_PACKAGES) + source],
+        capture_output=True,
+        text=True,
+    )
+    imported: List[str] = []
+    for line in result.stderr.splitlines():
+        if line.startswith("IMPORTED "):
+            imported = [package for package in line[9:].split(",") if package]
+    return {
+        "median_seconds": round(statistics.median(seconds), 3),
+        "min_seconds": round(min(seconds), 3),
+        "imported": imported,
+    }
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the startup of the CLI and API")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    results = {
+        name: run_scenario(source=SCENARIOS[name], repeat=args.repeat)
+        for name in args.scenarios
+    }
+    print(f"{'scenario':<22}{'median s':>10}{'min s':>8}  imported")
+    for name, result in results.items():
+        print(
+            f"{name:<22}{result['median_seconds']:>10.3f}{result['min_seconds']:>8.3f}"
+            f"  {', '.join(result['imported']) or '-'}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Build an offline lexeme form index from the Wikidata lexeme dump
+Download the dump first from
+https://dumps.wikimedia.org/wikidatawiki/entities/latest-lexemes.json.gz
+"""
+import logging
+from argparse import ArgumentParser
+
+import config
+from models.lexeme_index import LexemeIndexBuilder
+
+logging.basicConfig(level=config.loglevel)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Build an offline lexeme form index from the lexeme dump."
+    )
+    parser.add_argument(
+        "-d", "--dump", required=True, help="Path to latest-lexemes.json.gz"
+    )
+    parser.add_argument(
+        "-o", "--output", default="lexemes.idx", help="Index file to write"
+    )
+    parser.add_argument(
+        "-l",
+        "--lang",
+        action="append",
+        default=[],
+        help="Only index representations in this language code, can be repeated",
+    )
+    args = parser.parse_args()
+    logger.info("Starting")
+    builder = LexemeIndexBuilder(
+        dump_path=args.dump, index_path=args.output, languages=args.lang
+    )
+    builder.start()
@@ -4,3 +4,93 @@ import logging
 # this ignores all tokens shorter than these number of characters
 minimum_token_length = 10
 loglevel = logging.INFO
+
+# path to an offline lexeme form index built with build_lexeme_index.py
+# leave empty to look up forms in WDQS
+lexeme_index_path = ""
+
+# number of (representation, lexical category) pairs sent in one SPARQL query
+sparql_batch_size = 200
+
+# look up all lexical categories of the fallback cascade in one round
+# of batch queries instead of one round per cascade step
+single_query_matching = True
+
+# persistent cache of form lookups, leave empty to disable
+match_cache_path = "~/.cache/lexsrt/match_cache.sqlite3"
+# seconds before cached matches and cached misses are looked up again
+match_cache_positive_ttl = 30 * 24 * 3600
+match_cache_negative_ttl = 7 * 24 * 3600
+# least recently used entries are evicted above this size
+match_cache_max_entries = 1_000_000
+
+# persistent cache of the tokens of every cleaned cue, leave empty to disable
+token_cache_path = "~/.cache/lexsrt/tokens.sqlite3"
+token_cache_max_entries = 1_000_000
+
+# spaCy models loaded when the API starts
+preload_spacy_models: list = []
+# number of API workers forked by serve.py after loading the models
+prefork_workers = 4
+# least recently used spaCy models are evicted when they use more memory than this
+spacy_memory_budget_mb = 4096
+
+# tokenization with nlp.pipe, n_process > 1 uses worker processes
+spacy_batch_size = 256
+spacy_n_process = 1
+# worker processes tokenizing the files in corpus mode, -1 uses all cores
+corpus_processes = -1
+# components the matcher never reads, only pos_, norm_ and lang_ are used
+spacy_disabled_components = ["ner", "parser", "lemmatizer", "textcat", "senter"]
+
+# number of concurrent wbgetentities calls when fetching lexemes
+lexeme_fetch_workers = 4
+
+user_agent = "LexSrt/1.0 (https://www.wikidata.org/wiki/User:So9q)"
+# the API queries WDQS with a shared async client
+async_max_concurrent_queries = 8
+async_query_timeout = 60
+async_max_retries = 5
+# number of cues the API batch endpoints tokenize and match before streaming them
+api_stream_window = 100
+# number of cues matched together when processing a SRT as a stream
+stream_window_size = 500
+
+# format of the reports: "csv", "jsonl", "parquet" or "arrow"
+# parquet and arrow need pyarrow
+export_format = "csv"
+# rows buffered before a record batch is written to parquet and arrow files
+export_batch_rows = 10_000
+
+# per-file lexeme statistics merged into corpus reports, leave empty to disable
+corpus_index_path = ""
+
+# write-ahead journal of completed lookups in the output directory,
+# --resume continues an interrupted run from it
+journal_filename = "lexsrt-journal.jsonl"
+# tokens matched or lexemes fetched between two journal writes
+journal_chunk_size = 200
+
+# local store of downloaded lexemes, leave empty to always download them
+lexeme_store_path = "~/.cache/lexsrt/lexemes.sqlite3"
+# stored lexemes are revalidated against Wikidata after this many seconds
+lexeme_store_revalidate_after = 3600
+
+# record every HTTP response to the archive or replay a run from it without
+# network access, the mode is "record", "replay" or empty to disable it
+http_archive_mode = ""
+http_archive_path = ""
+
+# shared HTTP client used for all synchronous requests
+http_pool_size = 10
+http_timeout = 60
+http_max_retries = 10
+# requests in flight, halved on 429 and 503 and slowly increased after successes
+http_max_concurrency = 8
+http_min_concurrency = 1
+# seconds to pause when a throttled response has no Retry-After header
+http_default_retry_after = 5
+# seconds before retrying after a server error, connection error or timeout,
+# doubled after every failed attempt up to the maximum
+http_retry_backoff = 1.0
+http_max_retry_backoff = 60.0
@@ -0,0 +1,54 @@
+"""
+Write the lexeme frequency and sense coverage reports of a corpus index
+The index is filled by cli.py with --corpus-index, this only sums the
+stored per-file counts so no file is processed again.
+"""
+import logging
+from argparse import ArgumentParser
+
+import config
+from models.corpus_index import CorpusIndex
+from models.export import EXPORT_FORMATS
+from models.sqlite_store import open_store
+
+logging.basicConfig(level=config.loglevel)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Write the corpus reports from the merged per-file counts."
+    )
+    parser.add_argument(
+        "-x",
+        "--index",
+        required=True,
+        help="Corpus index made with cli.py --corpus-index",
+    )
+    parser.add_argument(
+        "-l", "--lang", required=True, help="Wikimedia supported language code"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default=".", help="Directory the reports are written to"
+    )
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default=config.export_format,
+        help="Format of the reports, parquet and arrow need pyarrow",
+    )
+    parser.add_argument(
+        "--remove",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="Remove the segment of this SRT file first, can be repeated",
+    )
+    args = parser.parse_args()
+    logger.info("Starting")
+    config.export_format = args.format
+    corpus_index = open_store(CorpusIndex, args.index)
+    for filename in args.remove:
+        corpus_index.remove_segment(filename=filename)
+    corpus_index.write_reports(
+        language_code=args.lang, output_directory=args.output_dir
+    )
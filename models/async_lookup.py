@@ -0,0 +1,241 @@
+"""Non-blocking form lookups for the API
+
+All SPARQL queries go through one pooled httpx.AsyncClient and the number of
+queries in flight is bounded by a semaphore, so a slow WDQS response only
+delays the request waiting for it. The match cache and the offline index
+are used exactly like in the synchronous lookups in from_ordia."""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+import config
+from models.exceptions import HttpRetryError
+from models.from_ordia import (
+    build_batch_query,
+    build_iso639_query,
+    lookup_forms_batch,
+    parse_batch_results,
+)
+from models.http_archive import get_async_transport
+from models.http_client import (
+    TRANSIENT_STATUS_CODES,
+    get_backoff,
+    parse_retry_after,
+)
+from models.match_cache import get_match_cache
+from models.metrics import downloaded_bytes, sparql_queries, sparql_query_duration
+from models.token import (
+    LexSrtToken,
+    apply_round_results,
+    get_cascade_rounds,
+    get_round_pairs,
+    set_match_errors,
+)
+from models.wikidata_tables import get_iso639_table
+
+logger = logging.getLogger(__name__)
+
+async_client: Optional[httpx.AsyncClient] = None
+query_semaphore: Optional[asyncio.Semaphore] = None
+languages: Dict[str, str] = dict()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """The shared client, created on first use inside the running event loop"""
+    global async_client, query_semaphore
+    if async_client is None:
+        async_client = httpx.AsyncClient(
+            headers={"User-Agent": config.user_agent},
+            transport=get_async_transport(
+                transport=httpx.AsyncHTTPTransport(
+                    limits=httpx.Limits(
+                        max_connections=config.async_max_concurrent_queries,
+                        max_keepalive_connections=config.async_max_concurrent_queries,
+                    )
+                )
+            ),
+            timeout=config.async_query_timeout,
+        )
+        query_semaphore = asyncio.Semaphore(config.async_max_concurrent_queries)
+    return async_client
+
+
+async def close_async_client():
+    global async_client, query_semaphore
+    if async_client is not None:
+        await async_client.aclose()
+        async_client = None
+        query_semaphore = None
+
+
+async def execute_sparql_query_async(query: str) -> Dict:
+    """Retries like the synchronous HTTP client, the pause between two
+    attempts is spent outside the semaphore so other queries can run"""
+    from wikibaseintegrator.wbi_config import config as wbi_config  # type: ignore
+
+    client = get_async_client()
+    assert query_semaphore is not None
+    problem = ""
+    for attempt in range(config.async_max_retries):
+        async with query_semaphore:
+            try:
+                response: Optional[httpx.Response] = await client.post(
+                    str(wbi_config["SPARQL_ENDPOINT_URL"]),
+                    data={"query": query, "format": "json"},
+                    headers={"Accept": "application/sparql-results+json"},
+                )
+            except httpx.TransportError as e:
+                response = None
+                problem = f"{type(e).__name__}: {e}"
+        if response is None:
+            logger.warning(f"WDQS query failed with {problem}, retrying")
+            pause = get_backoff(attempt=attempt)
+        else:
+            sparql_queries.inc(status=str(response.status_code))
+            sparql_query_duration.observe(response.elapsed.total_seconds())
+            downloaded_bytes.inc(len(response.content), source="sparql")
+            if response.status_code in (429, 503):
+                problem = f"status {response.status_code}"
+                pause = parse_retry_after(response.headers.get("retry-after"))
+                logger.error(
+                    f"WDQS answered {response.status_code}, "
+                    f"retrying in {pause:.1f} seconds"
+                )
+            elif response.status_code in TRANSIENT_STATUS_CODES:
+                problem = f"server error {response.status_code}"
+                pause = get_backoff(attempt=attempt)
+                logger.warning(f"WDQS answered {problem}, retrying")
+            else:
+                response.raise_for_status()
+                return response.json()
+        if attempt + 1 < config.async_max_retries:
+            await asyncio.sleep(pause)
+    raise HttpRetryError(
+        f"No result from WDQS after {config.async_max_retries} attempts, "
+        f"the last one failed with {problem}"
+    )
+
+
+async def iso639_to_q_async(iso639: str) -> str:
+    if iso639 not in languages and iso639 in get_iso639_table():
+        languages[iso639] = get_iso639_table()[iso639]
+    if iso639 not in languages:
+        data = await execute_sparql_query_async(query=build_iso639_query(iso639))
+        bindings = data["results"]["bindings"]
+        languages[iso639] = bindings[0]["code"]["value"][31:] if bindings else ""
+    return languages[iso639]
+
+
+async def lookup_forms_batch_in_wikidata_async(
+    iso639: str, pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], List[str]]:
+    if not pairs:
+        return {}
+    language = await iso639_to_q_async(iso639=iso639)
+    logger.info(f"Looking up {len(pairs)} representations in Wikidata")
+    data = await execute_sparql_query_async(
+        query=build_batch_query(iso639=iso639, language=language, pairs=pairs)
+    )
+    return parse_batch_results(data=data, pairs=pairs)
+
+
+async def lookup_forms_batch_async(
+    iso639: str, pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], List[str]]:
+    """Async version of from_ordia.lookup_forms_batch, the chunks of
+    missing pairs are queried concurrently"""
+    unique_pairs = list(dict.fromkeys(pairs))
+    if config.lexeme_index_path:
+        return await asyncio.to_thread(
+            lookup_forms_batch, iso639=iso639, pairs=unique_pairs
+        )
+    match_cache = get_match_cache()
+    results: Dict[Tuple[str, str], List[str]] = {}
+    if match_cache:
+        results.update(
+            await asyncio.to_thread(
+                match_cache.get_many, iso639=iso639, pairs=unique_pairs
+            )
+        )
+    missing_pairs = [pair for pair in unique_pairs if pair not in results]
+    chunks: List[List[Tuple[str, str]]] = []
+    for start in range(0, len(missing_pairs), config.sparql_batch_size):
+        end = start + config.sparql_batch_size
+        chunks.append(missing_pairs[start:end])
+    for batch_results in await asyncio.gather(
+        *[
+            lookup_forms_batch_in_wikidata_async(iso639=iso639, pairs=chunk)
+            for chunk in chunks
+        ]
+    ):
+        if match_cache:
+            await asyncio.to_thread(
+                match_cache.set_many, iso639=iso639, results=batch_results
+            )
+        results.update(batch_results)
+    return results
+
+
+async def lookup_forms_batch_with_known_forms_async(
+    iso639: str,
+    pairs: List[Tuple[str, str]],
+    known_forms: Dict[Tuple[str, Tuple[str, str]], List[str]],
+) -> Dict[Tuple[str, str], List[str]]:
+    """Only look up the pairs not already in known_forms and remember the results"""
+    results = {
+        pair: known_forms[(iso639, pair)]
+        for pair in pairs
+        if (iso639, pair) in known_forms
+    }
+    missing_pairs = [pair for pair in pairs if pair not in results]
+    if missing_pairs:
+        fetched = await lookup_forms_batch_async(iso639=iso639, pairs=missing_pairs)
+        for pair, forms in fetched.items():
+            known_forms[(iso639, pair)] = forms
+        results.update(fetched)
+    return results
+
+
+async def match_tokens_against_forms_in_wikidata_async(
+    tokens: List[LexSrtToken],
+    known_forms: Optional[Dict[Tuple[str, Tuple[str, str]], List[str]]] = None,
+) -> None:
+    """Async version of token.match_tokens_against_forms_in_wikidata,
+    the languages of a round are looked up concurrently
+
+    Pass the same known_forms dictionary to several calls to
+    deduplicate the lookups across all of them"""
+    if known_forms is None:
+        known_forms = dict()
+    logger.debug("match_tokens_against_forms_in_wikidata_async: running")
+    cascades = [token.lexical_category_cascade for token in tokens]
+    unmatched = list(range(len(tokens)))
+    for steps in get_cascade_rounds(cascades=cascades):
+        pairs_by_language = get_round_pairs(
+            tokens=tokens, cascades=cascades, unmatched=unmatched, steps=steps
+        )
+        iso639s = list(pairs_by_language)
+        language_results = await asyncio.gather(
+            *[
+                lookup_forms_batch_with_known_forms_async(
+                    iso639=iso639,
+                    pairs=pairs_by_language[iso639],
+                    known_forms=known_forms,
+                )
+                for iso639 in iso639s
+            ]
+        )
+        results: Dict[Tuple[str, Tuple[str, str]], List[str]] = {}
+        for iso639, language_result in zip(iso639s, language_results):
+            for pair, forms in language_result.items():
+                results[(iso639, pair)] = forms
+        unmatched = apply_round_results(
+            tokens=tokens,
+            cascades=cascades,
+            unmatched=unmatched,
+            steps=steps,
+            results=results,
+        )
+    set_match_errors(tokens=tokens, unmatched=unmatched)
@@ -0,0 +1,61 @@
+"""Cleaning of the cues before spaCy and filtering of junk tokens after it
+
+Most cues contain neither markup nor email addresses so cheap character
+checks decide first and BeautifulSoup or email_validator are only imported
+and used when a '<' or '&' or an '@' is actually present."""
+import logging
+import re
+from typing import Iterable, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# tags and character references are the only things BeautifulSoup changes
+MARKUP_PATTERN = re.compile(r"<|&")
+
+
+def remove_html_tags(text: str) -> str:
+    # BeautifulSoup also collapses text that is only whitespace
+    if text.strip() and not MARKUP_PATTERN.search(text):
+        return text
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(text, "html.parser")
+    return soup.get_text()
+
+
+def remove_hyphens_not_understood_by_spacy(text: str) -> str:
+    return text.replace("--", "")
+
+
+def clean_sentence(sentence: str) -> str:
+    sentence = remove_html_tags(sentence)
+    sentence = remove_hyphens_not_understood_by_spacy(sentence)
+    return sentence
+
+
+def clean_sentences(sentences: Iterable[str]) -> List[str]:
+    """Clean a whole batch of cues"""
+    return [clean_sentence(sentence) for sentence in sentences]
+
+
+def valid_email(text: str) -> bool:
+    # an address always has an @ so the validator is only needed then
+    if "@" not in text:
+        return False
+    from email_validator import EmailNotValidError, validate_email
+
+    try:
+        # Check that the email address is valid. Turn on check_deliverability
+        # for first-time validations like on account creation pages (but not
+        # login pages).
+        validate_email(text, check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+
+def filter_tokens(tokens: Iterable[T]) -> List[T]:
+    """Filter the tokens to remove junk like emails"""
+    return [token for token in tokens if not valid_email(token.text)]  # type: ignore
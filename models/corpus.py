@@ -0,0 +1,302 @@
+"""Corpus mode: process a directory or glob of SRT files in one job
+
+Each worker process loads the spaCy model once and tokenizes whole files.
+The tokens of all files are deduplicated in the main process and matched
+in one go through the batch lookup and the shared match cache, so a word
+is only looked up once per corpus. Lexemes are fetched once as well.
+
+All cores are used unless --processes says otherwise. Every worker opens
+the token cache for writing, SQLite serializes the writes and a worker
+waits up to SqliteStore.busy_timeout seconds for the others."""
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+from srt import Subtitle, parse  # type: ignore
+
+import config
+from models import LexSrt
+from models.corpus_index import CorpusIndex, Segment, get_corpus_index
+from models.export import LEXEME_REPORT, MATCH_ERROR_REPORT, write_report
+from models.lexeme_fetcher import LexemeFetcher
+from models.spacy_model_registry import spacy_models
+from models.srt_stream import remove_commercial_and_credits
+from models.token import LexSrtToken, match_tokens_against_forms_in_wikidata
+from models.token_cache import CompactToken, tokenize
+
+if TYPE_CHECKING:
+    from wikibaseintegrator.entities import LexemeEntity  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class FileTokens(BaseModel):
+    filename: str
+    number_of_subtitles: int = 0
+    number_of_tokens: int = 0
+    tokens_above_minimum_length: List[CompactToken] = list()
+    # index, start and end of every cue, the content is not needed
+    cues: List[Tuple[int, timedelta, timedelta]] = list()
+    # the position in cues of every token above the minimum length
+    token_cues: List[int] = list()
+
+    def iterate_occurrence_rows(
+        self, unique_tokens: Dict[Tuple[str, str], LexSrtToken]
+    ) -> Iterator[Dict[str, Any]]:
+        subtitles = [
+            Subtitle(index=index, start=start, end=end, content="")
+            for index, start, end in self.cues
+        ]
+        for position, (text, _, pos, _) in zip(
+            self.token_cues, self.tokens_above_minimum_length
+        ):
+            yield LexSrt.get_occurrence_row(
+                subtitle=subtitles[position],
+                text=text,
+                pos=pos,
+                token=unique_tokens[(text, pos)],
+            )
+
+
+def init_worker(spacy_model: str):
+    """Load the model once per worker process"""
+    spacy_models.get(spacy_model=spacy_model)
+
+
+def tokenize_file(filename: str, spacy_model: str, encoding: str) -> FileTokens:
+    """Runs in a worker process, only plain data is sent back"""
+    print(f"Tokenizing {filename}")
+    lexsrt = LexSrt(filename=filename, encoding=encoding)
+    with open(filename, encoding=encoding) as file:
+        subtitles = list(parse(file.read()))
+    contents = remove_commercial_and_credits(
+        [subtitle.content for subtitle in subtitles]
+    )
+    nlp = spacy_models.get(spacy_model=spacy_model)
+    file_tokens = FileTokens(
+        filename=filename,
+        number_of_subtitles=len(contents),
+        # only trailing cues are removed so the rest line up with the contents
+        cues=[
+            (subtitle.index, subtitle.start, subtitle.end)
+            for subtitle in subtitles[: len(contents)]
+        ],
+    )
+    for position, tokens in enumerate(
+        tokenize(
+            nlp=nlp,
+            sentences=[lexsrt.clean_sentence(sentence) for sentence in contents],
+        )
+    ):
+        file_tokens.number_of_tokens += len(tokens)
+        for token in tokens:
+            if len(token[0]) > config.minimum_token_length:
+                file_tokens.tokens_above_minimum_length.append(token)
+                file_tokens.token_cues.append(position)
+    return file_tokens
+
+
+class LexSrtCorpus(BaseModel):
+    pattern: str
+    language_code: str
+    spacy_model: str
+    encoding: str = "utf-8"
+    output_directory: str = "."
+    processes: int = config.corpus_processes
+
+    def get_filenames(self) -> List[str]:
+        if os.path.isdir(self.pattern):
+            return sorted(glob.glob(os.path.join(self.pattern, "*.srt")))
+        return sorted(glob.glob(self.pattern))
+
+    def get_file_output_directory(self, filename: str, root: str) -> str:
+        """The path of the file below the common root without the extension,
+        files with the same name in different directories do not collide"""
+        relative_path = os.path.relpath(os.path.abspath(filename), root)
+        return os.path.join(self.output_directory, os.path.splitext(relative_path)[0])
+
+    def tokenize_files(self, filenames: List[str]) -> List[FileTokens]:
+        processes = min(
+            self.processes if self.processes > 0 else os.cpu_count() or 1,
+            len(filenames),
+        )
+        print(f"Tokenizing {len(filenames)} files using {processes} processes")
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=init_worker,
+            initargs=(self.spacy_model,),
+        ) as executor:
+            return list(
+                executor.map(
+                    tokenize_file,
+                    filenames,
+                    repeat(self.spacy_model),
+                    repeat(self.encoding),
+                )
+            )
+
+    def __get_unique_tokens__(
+        self, files: List[FileTokens]
+    ) -> Dict[Tuple[str, str], LexSrtToken]:
+        """One LexSrtToken per unique text and PoS across all files"""
+        unique_tokens: Dict[Tuple[str, str], LexSrtToken] = {}
+        for file_tokens in files:
+            for text, norm, pos, lang in file_tokens.tokens_above_minimum_length:
+                if (text, pos) not in unique_tokens:
+                    unique_tokens[(text, pos)] = LexSrtToken(
+                        text=text, norm_=norm, pos_=pos, lang_=lang
+                    )
+        return unique_tokens
+
+    def __write_results__(
+        self,
+        output_directory: str,
+        tokens: List[LexSrtToken],
+        lexemes: Dict[str, "LexemeEntity"],
+        occurrence_rows: Iterable[Dict[str, Any]] = (),
+    ) -> LexSrt:
+        lexeme_ids = LexemeFetcher.get_lexeme_ids(
+            entity_ids=[form for token in tokens for form in token.forms]
+        )
+        lexsrt = LexSrt(
+            language_code=self.language_code,
+            output_directory=output_directory,
+            tokens_above_minimum_length=tokens,
+            unique_wbi_lexemes=[
+                lexemes[lexeme_id] for lexeme_id in lexeme_ids if lexeme_id in lexemes
+            ],
+        )
+        lexsrt.create_lexeme_dataframe()
+        lexsrt.create_match_error_dataframe()
+        lexsrt.write_reports(occurrence_rows=occurrence_rows)
+        return lexsrt
+
+    def __add_segment__(
+        self,
+        corpus_index: CorpusIndex,
+        file_tokens: FileTokens,
+        unique_tokens: Dict[Tuple[str, str], LexSrtToken],
+        lexsrt: LexSrt,
+    ):
+        segment = Segment.for_file(
+            filename=file_tokens.filename,
+            language_code=self.language_code,
+            spacy_model=self.spacy_model,
+            number_of_subtitles=file_tokens.number_of_subtitles,
+            number_of_tokens=file_tokens.number_of_tokens,
+        )
+        for text, norm, pos, _ in file_tokens.tokens_above_minimum_length:
+            segment.add_occurrence(
+                text=text, norm=norm, forms=unique_tokens[(text, pos)].forms
+            )
+        for row in lexsrt.__get_records__(lexsrt.lexeme_dataframe):
+            segment.add_lexeme_row(row=row)
+        corpus_index.add_segment(segment=segment)
+
+    def start(self):
+        filenames = self.get_filenames()
+        if not filenames:
+            print(f"No SRT files found using '{self.pattern}'")
+            return
+        # taken before skipping indexed files so every run uses the same directories
+        root = os.path.commonpath(
+            [os.path.dirname(os.path.abspath(filename)) for filename in filenames]
+        )
+        corpus_index = get_corpus_index()
+        if corpus_index is not None:
+            new_filenames = [
+                filename
+                for filename in filenames
+                if not corpus_index.has_segment(
+                    filename=filename,
+                    language_code=self.language_code,
+                    spacy_model=self.spacy_model,
+                )
+            ]
+            print(
+                f"Skipping {len(filenames) - len(new_filenames)} files that are "
+                f"already in the corpus index"
+            )
+            filenames = new_filenames
+        if not filenames:
+            self.__write_corpus_index_reports__(corpus_index=corpus_index)
+            return
+        files = self.tokenize_files(filenames=filenames)
+        unique_tokens = self.__get_unique_tokens__(files=files)
+        print(
+            f"Found {sum(file_tokens.number_of_tokens for file_tokens in files)} "
+            f"tokens in {len(files)} files, {len(unique_tokens)} unique tokens "
+            f"are longer than the minimum token length ({config.minimum_token_length})"
+        )
+        match_tokens_against_forms_in_wikidata(tokens=list(unique_tokens.values()))
+        fetcher = LexSrt.get_lexeme_fetcher()
+        lexemes = {
+            lexeme.id: lexeme
+            for lexeme in fetcher.fetch(
+                entity_ids=[
+                    form for token in unique_tokens.values() for form in token.forms
+                ]
+            )
+        }
+        for file_tokens in files:
+            keys = dict.fromkeys(
+                (compact_token[0], compact_token[2])
+                for compact_token in file_tokens.tokens_above_minimum_length
+            )
+            lexsrt = self.__write_results__(
+                output_directory=self.get_file_output_directory(
+                    filename=file_tokens.filename, root=root
+                ),
+                tokens=[unique_tokens[key] for key in keys],
+                lexemes=lexemes,
+                occurrence_rows=file_tokens.iterate_occurrence_rows(
+                    unique_tokens=unique_tokens
+                ),
+            )
+            if corpus_index is not None:
+                self.__add_segment__(
+                    corpus_index=corpus_index,
+                    file_tokens=file_tokens,
+                    unique_tokens=unique_tokens,
+                    lexsrt=lexsrt,
+                )
+        if corpus_index is None:
+            self.__write_results__(
+                output_directory=self.output_directory,
+                tokens=list(unique_tokens.values()),
+                lexemes=lexemes,
+            )
+        print(f"Wrote the results for {len(files)} files to {self.output_directory}")
+        self.__write_corpus_index_reports__(corpus_index=corpus_index)
+
+    def __write_corpus_index_reports__(self, corpus_index: Optional[CorpusIndex]):
+        """With an index the corpus reports cover every indexed file,
+        not only the ones processed in this run"""
+        if corpus_index is None:
+            return
+        write_report(
+            output_directory=self.output_directory,
+            report=LEXEME_REPORT,
+            rows=corpus_index.lexeme_rows(language_code=self.language_code),
+        )
+        write_report(
+            output_directory=self.output_directory,
+            report=MATCH_ERROR_REPORT,
+            rows=[
+                LexSrt.get_match_error_row(
+                    token=LexSrtToken(text=text, norm_=norm, pos_="", lang_="")
+                )
+                for text, norm in corpus_index.match_errors(
+                    language_code=self.language_code
+                )
+            ],
+        )
+        corpus_index.write_reports(
+            language_code=self.language_code,
+            output_directory=self.output_directory,
+        )
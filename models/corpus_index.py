@@ -0,0 +1,343 @@
+"""Persistent corpus index of per-file lexeme statistics
+
+Every processed SRT file becomes one segment holding its form, lexeme and
+match error counts. Segments never depend on each other, so a new episode
+is added without touching the others and a changed file simply replaces
+its segment. The corpus-wide reports are sums over the segments computed
+by SQLite, which takes seconds even for thousands of films.
+
+Segments are keyed by the absolute path. The SHA-256 of the file, the
+language and the spaCy model are stored with it so an unchanged file
+processed the same way is recognized and skipped on the next run."""
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+import config
+from models.export import LEXEME_FREQUENCY_REPORT, SENSE_COVERAGE_REPORT, write_report
+from models.sqlite_store import SqliteStore, get_store
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Segment(BaseModel):
+    """The counts of one file, filled while the file is processed"""
+
+    filename: str
+    language_code: str
+    spacy_model: str = ""
+    number_of_subtitles: int = 0
+    number_of_tokens: int = 0
+    form_counts: Counter = Counter()
+    lexeme_counts: Counter = Counter()
+    # keyed by the text and the norm of the token
+    match_error_counts: Counter = Counter()
+    # lexeme rows like in the lexemes report, keyed by lexeme id
+    lexemes: Dict[str, Dict[str, Any]] = dict()
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def for_file(cls, filename: str, **kwargs) -> "Segment":
+        """Segments are keyed by the absolute path"""
+        return cls(filename=os.path.abspath(filename), **kwargs)
+
+    def add_occurrence(self, text: str, norm: str, forms: Iterable[str]):
+        """One token longer than the minimum length found in a cue,
+        tokens without forms are match errors"""
+        forms = list(forms)
+        if not forms:
+            self.match_error_counts[(text, norm)] += 1
+            return
+        self.form_counts.update(forms)
+        # several forms of one token can belong to the same lexeme
+        self.lexeme_counts.update({form.split("-")[0] for form in forms})
+
+    def add_lexeme_row(self, row: Dict[str, Any]):
+        self.lexemes[row["id"]] = row
+
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    language_code TEXT NOT NULL,
+    spacy_model TEXT NOT NULL,
+    subtitles INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS form_counts (
+    segment_id INTEGER NOT NULL REFERENCES segments ON DELETE CASCADE,
+    form_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (segment_id, form_id)
+);
+CREATE TABLE IF NOT EXISTS lexeme_counts (
+    segment_id INTEGER NOT NULL REFERENCES segments ON DELETE CASCADE,
+    lexeme_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (segment_id, lexeme_id)
+);
+CREATE INDEX IF NOT EXISTS lexeme_counts_lexeme ON lexeme_counts (lexeme_id);
+CREATE TABLE IF NOT EXISTS match_error_counts (
+    segment_id INTEGER NOT NULL REFERENCES segments ON DELETE CASCADE,
+    text TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (segment_id, text, norm)
+);
+CREATE TABLE IF NOT EXISTS lexemes (
+    language_code TEXT NOT NULL,
+    id TEXT NOT NULL,
+    lemma TEXT NOT NULL,
+    senses TEXT NOT NULL,
+    has_senses INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (language_code, id)
+);"""
+
+
+class CorpusIndex(SqliteStore):
+    description: ClassVar[str] = "corpus index"
+    pragmas: ClassVar[List[str]] = ["journal_mode=WAL", "foreign_keys=ON"]
+    sql_schema: ClassVar[str] = SCHEMA
+
+    def has_segment(self, filename: str, language_code: str, spacy_model: str) -> bool:
+        """True if the file is indexed with the same language and model
+        and has not changed since"""
+        with self._lock:
+            row = self.__connection__.execute(
+                "SELECT sha256, language_code, spacy_model FROM segments "
+                "WHERE filename = ?",
+                (os.path.abspath(filename),),
+            ).fetchone()
+        return row is not None and tuple(row) == (
+            file_sha256(filename),
+            language_code,
+            spacy_model,
+        )
+
+    def add_segment(self, segment: Segment):
+        """Add the segment of a file, replacing the old one if it was indexed"""
+        sha256 = file_sha256(segment.filename)
+        with self._lock:
+            connection = self.__connection__
+            connection.execute(
+                "DELETE FROM segments WHERE filename = ?", (segment.filename,)
+            )
+            segment_id = connection.execute(
+                "INSERT INTO segments (filename, sha256, language_code, spacy_model, "
+                "subtitles, tokens, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    segment.filename,
+                    sha256,
+                    segment.language_code,
+                    segment.spacy_model,
+                    segment.number_of_subtitles,
+                    segment.number_of_tokens,
+                    time.time(),
+                ),
+            ).lastrowid
+            for table, column, counts in (
+                ("form_counts", "form_id", segment.form_counts),
+                ("lexeme_counts", "lexeme_id", segment.lexeme_counts),
+            ):
+                connection.executemany(
+                    f"INSERT INTO {table} (segment_id, {column}, count) "
+                    "VALUES (?, ?, ?)",
+                    [(segment_id, key, count) for key, count in counts.items()],
+                )
+            connection.executemany(
+                "INSERT INTO match_error_counts (segment_id, text, norm, count) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (segment_id, text, norm, count)
+                    for (text, norm), count in segment.match_error_counts.items()
+                ],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO lexemes VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        segment.language_code,
+                        row["id"],
+                        row["localized lemma"],
+                        row["localized senses"],
+                        int(row["has at least one sense"]),
+                        row["url"],
+                    )
+                    for row in segment.lexemes.values()
+                ],
+            )
+            connection.commit()
+        logger.info(f"Indexed {segment.filename} as segment {segment_id}")
+
+    def remove_segment(self, filename: str):
+        """Forget a file, e.g. an episode that was deleted"""
+        with self._lock:
+            self.__connection__.execute(
+                "DELETE FROM segments WHERE filename = ?", (os.path.abspath(filename),)
+            )
+            self.__connection__.commit()
+        logger.info(f"Removed {filename} from the corpus index")
+
+    def __query__(self, sql: str, parameters: Any) -> List[Dict[str, Any]]:
+        with self._lock:
+            cursor = self.__connection__.execute(sql, parameters)
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def lexeme_rows(self, language_code: str) -> List[Dict[str, Any]]:
+        """The lexemes found in any segment like in the lexemes report"""
+        rows = self.__query__(
+            """SELECT DISTINCT lexemes.id AS "id",
+                   lexemes.lemma AS "localized lemma",
+                   lexemes.senses AS "localized senses",
+                   lexemes.has_senses AS "has at least one sense",
+                   lexemes.url AS "url"
+               FROM lexemes
+               JOIN lexeme_counts ON lexeme_counts.lexeme_id = lexemes.id
+               JOIN segments ON segments.id = lexeme_counts.segment_id
+                   AND segments.language_code = lexemes.language_code
+               WHERE lexemes.language_code = ?
+               ORDER BY 2, 1""",
+            (language_code,),
+        )
+        for row in rows:
+            row["has at least one sense"] = bool(row["has at least one sense"])
+        return rows
+
+    def match_errors(self, language_code: str) -> List[Tuple[str, str]]:
+        """The text and norm of every token without forms in any segment"""
+        return [
+            (row["text"], row["norm"])
+            for row in self.__query__(
+                """SELECT DISTINCT match_error_counts.text, match_error_counts.norm
+                   FROM match_error_counts
+                   JOIN segments ON segments.id = match_error_counts.segment_id
+                   WHERE segments.language_code = ?
+                   ORDER BY 1, 2""",
+                (language_code,),
+            )
+        ]
+
+    def lexeme_frequencies(self, language_code: str) -> List[Dict[str, Any]]:
+        """Occurrences of every lexeme summed over all segments"""
+        rows = self.__query__(
+            """SELECT lexeme_counts.lexeme_id AS "id",
+                   COALESCE(lexemes.lemma, '') AS "localized lemma",
+                   SUM(lexeme_counts.count) AS "occurrences",
+                   COUNT(*) AS "files",
+                   COALESCE(lexemes.has_senses, 0) = 1 AS "has at least one sense",
+                   COALESCE(lexemes.url, '') AS "url"
+               FROM lexeme_counts
+               JOIN segments ON segments.id = lexeme_counts.segment_id
+               LEFT JOIN lexemes ON lexemes.language_code = segments.language_code
+                   AND lexemes.id = lexeme_counts.lexeme_id
+               WHERE segments.language_code = ?
+               GROUP BY lexeme_counts.lexeme_id
+               ORDER BY 3 DESC, 1""",
+            (language_code,),
+        )
+        for row in rows:
+            row["has at least one sense"] = bool(row["has at least one sense"])
+        return rows
+
+    def sense_coverage(self, language_code: str) -> List[Dict[str, Any]]:
+        """Share of the lexemes and of their occurrences that have at least one
+        sense, per file and for the whole corpus in the last row"""
+        rows = self.__query__(
+            """SELECT segments.filename AS "file",
+                   segments.subtitles AS "subtitles",
+                   segments.tokens AS "tokens",
+                   COUNT(lexeme_counts.lexeme_id) AS "lexemes",
+                   COALESCE(SUM(lexemes.has_senses), 0) AS "lexemes with senses",
+                   COALESCE(SUM(lexeme_counts.count), 0) AS "occurrences",
+                   COALESCE(SUM(lexeme_counts.count * lexemes.has_senses), 0)
+                       AS "occurrences with senses"
+               FROM segments
+               LEFT JOIN lexeme_counts ON lexeme_counts.segment_id = segments.id
+               LEFT JOIN lexemes ON lexemes.language_code = segments.language_code
+                   AND lexemes.id = lexeme_counts.lexeme_id
+               WHERE segments.language_code = ?
+               GROUP BY segments.id
+               ORDER BY segments.filename""",
+            (language_code,),
+        )
+        (corpus,) = self.__query__(
+            """SELECT 'corpus' AS "file",
+                   (SELECT COALESCE(SUM(subtitles), 0) FROM segments
+                    WHERE language_code = :language_code) AS "subtitles",
+                   (SELECT COALESCE(SUM(tokens), 0) FROM segments
+                    WHERE language_code = :language_code) AS "tokens",
+                   COUNT(DISTINCT lexeme_counts.lexeme_id) AS "lexemes",
+                   COUNT(DISTINCT CASE WHEN lexemes.has_senses = 1
+                       THEN lexeme_counts.lexeme_id END) AS "lexemes with senses",
+                   COALESCE(SUM(lexeme_counts.count), 0) AS "occurrences",
+                   COALESCE(SUM(lexeme_counts.count * lexemes.has_senses), 0)
+                       AS "occurrences with senses"
+               FROM lexeme_counts
+               JOIN segments ON segments.id = lexeme_counts.segment_id
+               LEFT JOIN lexemes ON lexemes.language_code = segments.language_code
+                   AND lexemes.id = lexeme_counts.lexeme_id
+               WHERE segments.language_code = :language_code""",
+            {"language_code": language_code},
+        )
+        rows.append(corpus)
+        for row in rows:
+            row["lexeme coverage"] = (
+                round(row["lexemes with senses"] / row["lexemes"], 4)
+                if row["lexemes"]
+                else 0.0
+            )
+            row["occurrence coverage"] = (
+                round(row["occurrences with senses"] / row["occurrences"], 4)
+                if row["occurrences"]
+                else 0.0
+            )
+        return rows
+
+    @property
+    def number_of_segments(self) -> int:
+        with self._lock:
+            (count,) = self.__connection__.execute(
+                "SELECT COUNT(*) FROM segments"
+            ).fetchone()
+        return count
+
+    def write_reports(self, language_code: str, output_directory: str):
+        """Write the lexeme frequency and sense coverage reports of the corpus"""
+        write_report(
+            output_directory=output_directory,
+            report=LEXEME_FREQUENCY_REPORT,
+            rows=self.lexeme_frequencies(language_code),
+        )
+        write_report(
+            output_directory=output_directory,
+            report=SENSE_COVERAGE_REPORT,
+            rows=self.sense_coverage(language_code),
+        )
+        print(
+            f"Wrote the lexeme frequencies and sense coverage of "
+            f"{self.number_of_segments} indexed files to {output_directory}"
+        )
+
+
+def get_corpus_index() -> Optional[CorpusIndex]:
+    """The corpus index or None if it is disabled in the config"""
+    return get_store(CorpusIndex, config.corpus_index_path)
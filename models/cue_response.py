@@ -0,0 +1,13 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from models.token_response import TokenResponse
+
+
+class CueResponse(BaseModel):
+    index: int
+    sentence: str
+    data: List[TokenResponse]
+    start: Optional[str] = None
+    end: Optional[str] = None
@@ -8,3 +8,27 @@ class MatchError(BaseException):
 
 class LanguageCodeError(BaseException):
     pass
+
+
+class LexSrtError(Exception):
+    """Base of the errors raised by the lookups, caches and exports"""
+
+
+class ReplayMissError(LexSrtError):
+    pass
+
+
+class WikibaseApiError(LexSrtError):
+    pass
+
+
+class ExportFormatError(LexSrtError):
+    pass
+
+
+class JournalError(LexSrtError):
+    pass
+
+
+class HttpRetryError(LexSrtError):
+    pass
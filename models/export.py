@@ -0,0 +1,265 @@
+"""Writers for the reports in CSV, JSON Lines, Parquet and Arrow IPC
+
+All writers append rows as they are produced and only create the file when
+the first row arrives. The Parquet and Arrow writers buffer
+config.export_batch_rows rows and write them as one record batch, so memory
+stays bounded for any number of films. They need pyarrow, which is optional
+and only imported when one of these formats is used."""
+import csv
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Union
+
+from pydantic import BaseModel
+
+import config
+from models.exceptions import ExportFormatError
+
+logger = logging.getLogger(__name__)
+
+CSV = "csv"
+JSONL = "jsonl"
+PARQUET = "parquet"
+ARROW = "arrow"
+EXPORT_FORMATS = [CSV, JSONL, PARQUET, ARROW]
+ARROW_FORMATS = [PARQUET, ARROW]
+
+
+class Report(BaseModel):
+    """Name of the output file without extension and the type of every column"""
+
+    name: str
+    # column name to "string", "int64", "double", "bool" or "list<string>"
+    columns: Dict[str, str]
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+
+LEXEME_REPORT = Report(
+    name="lexemes",
+    columns={
+        "id": "string",
+        "localized lemma": "string",
+        "localized senses": "string",
+        "has at least one sense": "bool",
+        "url": "string",
+    },
+)
+MATCH_ERROR_REPORT = Report(
+    name="match_errors",
+    columns={"text": "string", "ordia url": "string", "google url": "string"},
+)
+# one row per token longer than the minimum length in every cue
+OCCURRENCE_REPORT = Report(
+    name="occurrences",
+    columns={
+        "cue index": "int64",
+        "start": "string",
+        "end": "string",
+        "text": "string",
+        "pos": "string",
+        "forms": "list<string>",
+    },
+)
+# reports of the corpus index, summed over all indexed files
+LEXEME_FREQUENCY_REPORT = Report(
+    name="lexeme_frequencies",
+    columns={
+        "id": "string",
+        "localized lemma": "string",
+        "occurrences": "int64",
+        "files": "int64",
+        "has at least one sense": "bool",
+        "url": "string",
+    },
+)
+# one row per file and a last row for the whole corpus
+SENSE_COVERAGE_REPORT = Report(
+    name="sense_coverage",
+    columns={
+        "file": "string",
+        "subtitles": "int64",
+        "tokens": "int64",
+        "lexemes": "int64",
+        "lexemes with senses": "int64",
+        "occurrences": "int64",
+        "occurrences with senses": "int64",
+        "lexeme coverage": "double",
+        "occurrence coverage": "double",
+    },
+)
+
+
+class CsvRowWriter(BaseModel):
+    """Append rows to a CSV file as they are produced,
+    the layout is the same as DataFrame.to_csv with an index column"""
+
+    filename: str
+    columns: List[str]
+    file: Optional[TextIO] = None
+    writer: Any = None
+    number_of_rows: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def write(self, row: Dict[str, Any]):
+        if self.file is None:
+            self.file = open(self.filename, "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file, lineterminator=os.linesep)
+            self.writer.writerow([""] + self.columns)
+        self.writer.writerow(
+            [self.number_of_rows]
+            + [
+                " ".join(row[column]) if isinstance(row[column], list) else row[column]
+                for column in self.columns
+            ]
+        )
+        self.number_of_rows += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class JsonLinesRowWriter(BaseModel):
+    """One JSON object per row"""
+
+    filename: str
+    columns: List[str]
+    file: Optional[TextIO] = None
+    number_of_rows: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def write(self, row: Dict[str, Any]):
+        if self.file is None:
+            self.file = open(self.filename, "w", encoding="utf-8")
+        self.file.write(
+            json.dumps(
+                {column: row[column] for column in self.columns}, ensure_ascii=False
+            )
+            + "\n"
+        )
+        self.number_of_rows += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def import_pyarrow():
+    try:
+        import pyarrow  # type: ignore
+    except ImportError as e:
+        raise ExportFormatError(
+            f"The formats {', '.join(ARROW_FORMATS)} need pyarrow, "
+            f"install it with 'pip install pyarrow'"
+        ) from e
+    return pyarrow
+
+
+class ArrowRowWriter(BaseModel):
+    """Write the rows in record batches to a Parquet or Arrow IPC file"""
+
+    filename: str
+    report: Report
+    export_format: str
+    batch_rows: int = config.export_batch_rows
+    rows: List[Dict[str, Any]] = list()
+    writer: Any = None
+    arrow_schema: Any = None
+    number_of_rows: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __open__(self):
+        pyarrow = import_pyarrow()
+        types = {
+            "string": pyarrow.string(),
+            "int64": pyarrow.int64(),
+            "double": pyarrow.float64(),
+            "bool": pyarrow.bool_(),
+            "list<string>": pyarrow.list_(pyarrow.string()),
+        }
+        self.arrow_schema = pyarrow.schema(
+            [(name, types[type_]) for name, type_ in self.report.columns.items()]
+        )
+        if self.export_format == PARQUET:
+            import pyarrow.parquet  # type: ignore
+
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self.filename, self.arrow_schema
+            )
+        else:
+            import pyarrow.ipc  # type: ignore
+
+            self.writer = pyarrow.ipc.new_file(self.filename, self.arrow_schema)
+
+    def write(self, row: Dict[str, Any]):
+        self.rows.append(row)
+        self.number_of_rows += 1
+        if len(self.rows) >= self.batch_rows:
+            self.__flush__()
+
+    def __flush__(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.__open__()
+        pyarrow = import_pyarrow()
+        batch = pyarrow.RecordBatch.from_pylist(self.rows, schema=self.arrow_schema)
+        if self.export_format == PARQUET:
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write(batch)
+        self.rows = list()
+
+    def close(self):
+        self.__flush__()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def check_export_format(export_format: str):
+    """Fail before processing instead of when the first row is written"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportFormatError(
+            f"Unknown export format '{export_format}', "
+            f"use one of {', '.join(EXPORT_FORMATS)}"
+        )
+    if export_format in ARROW_FORMATS:
+        import_pyarrow()
+
+
+def write_report(output_directory: str, report: Report, rows: Iterable[Dict[str, Any]]):
+    """Write all rows of a report and close the file"""
+    writer = get_row_writer(output_directory=output_directory, report=report)
+    try:
+        for row in rows:
+            writer.write(row=row)
+    finally:
+        writer.close()
+
+
+def get_row_writer(
+    output_directory: str, report: Report, export_format: str = ""
+) -> Union[CsvRowWriter, JsonLinesRowWriter, ArrowRowWriter]:
+    """The writer of the report in the configured format"""
+    export_format = export_format or config.export_format
+    check_export_format(export_format)
+    os.makedirs(output_directory, exist_ok=True)
+    filename = os.path.join(output_directory, f"{report.name}.{export_format}")
+    if export_format == CSV:
+        return CsvRowWriter(filename=filename, columns=report.column_names)
+    if export_format == JSONL:
+        return JsonLinesRowWriter(filename=filename, columns=report.column_names)
+    return ArrowRowWriter(filename=filename, report=report, export_format=export_format)
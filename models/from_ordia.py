@@ -3,20 +3,42 @@ https://github.com/fnielsen/ordia/blob/db4af5029044f5010204ec6516549ccb318dc259/
 Author: Finn Nielsen
 License: Apache 2.0, see https://github.com/fnielsen/ordia/blob/master/LICENSE
 
-The code was improved to use WikibaseIntegrator for
+The code was improved to use the shared HTTP client for
 better error handling and standardization"""
 import logging
 from functools import lru_cache
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
 
-import requests
-from spacy.tokens import Token
-from wikibaseintegrator.wbi_helpers import execute_sparql_query  # type: ignore
+import config
+from models.http_client import execute_sparql_query
+from models.lexeme_index import get_lexeme_index
+from models.match_cache import get_match_cache
+from models.wikidata_tables import build_lexical_category_pattern, get_iso639_table
 
-from models.exceptions import MissingInformationError
+if TYPE_CHECKING:
+    from spacy.tokens import Token
 
 logger = logging.getLogger(__name__)
 
+POSTAG_TO_Q = {
+    "ADJ": "Q34698",
+    "ADV": "Q380057",
+    "INTJ": "Q83034",
+    "NOUN": "Q1084",
+    "PROPB": "Q147276",
+    "VERB": "Q24905",
+    "ADP": "Q134316",
+    "AUX": "Q24905",
+    "CCONJ": "Q36484",
+    "DET": "Q576271",
+    "NUM": "Q63116",
+    "PART": "Q184943",
+    "PRON": "Q36224",
+    "PROPN": "Q147276",
+    "SCONJ": "Q36484",
+}
+PUNCTUATION_POSTAGS = ["PUNCT", "SYM", "X"]
+
 
 def escape_string(string):
     r"""Escape string to be used in SPARQL query.
@@ -43,6 +65,19 @@ def escape_string(string):
     return string.replace("\\", "\\\\").replace('"', r"\"")
 
 
+def build_iso639_query(iso639: str) -> str:
+    if len(iso639) == 2:
+        property = "wdt:P218"
+    elif len(iso639) == 3:
+        property = "wdt:P219"
+    else:
+        raise ValueError("Wrong length of `iso639`")
+
+    return 'SELECT ?code WHERE {{ ?code {property} "{iso639}" }}'.format(
+        property=property, iso639=escape_string(iso639)
+    )
+
+
 @lru_cache(maxsize=1048)
 def iso639_to_q(iso639):
     """Convert ISO 639 to Wikidata ID.
@@ -72,26 +107,12 @@ def iso639_to_q(iso639):
     True
 
     """
-    if len(iso639) == 2:
-        property = "wdt:P218"
-    elif len(iso639) == 3:
-        property = "wdt:P219"
-    else:
-        raise ValueError("Wrong length of `iso639`")
+    language = get_iso639_table().get(iso639)
+    if language:
+        return language
+    query = build_iso639_query(iso639)
 
-    query = 'SELECT ?code WHERE {{ ?code {property} "{iso639}" }}'.format(
-        property=property, iso639=escape_string(iso639)
-    )
-
-    url = "https://query.wikidata.org/sparql"
-    params = {"query": query, "format": "json"}
-    response = requests.get(
-        url,
-        params=params,  # headers=HEADERS,
-        # Arbitrary set timeout to please bandit
-        timeout=10,
-    )
-    data = response.json()
+    data = execute_sparql_query(query=query)
 
     bindings = data["results"]["bindings"]
     if bindings:
@@ -100,24 +121,76 @@ def iso639_to_q(iso639):
         return ""
 
 
-@lru_cache(maxsize=1048)
-def spacy_token_to_forms(
-    token: Optional[Token] = None,
-    lookup_proper_noun_as_noun: bool = False,
-    lookup_proper_noun_as_adjective: bool = False,
-    overwrite_as_noun: bool = False,
-    overwrite_as_verb: bool = False,
-    overwrite_as_adjective: bool = False,
-):
-    """Identify Wikidata lexeme from spaCy token.
+def clean_representation(norm: str) -> str:
+    """Remove the quotes and hyphens spaCy keeps in the norm"""
+    return norm.replace('"', "").replace("-", "")
+
+
+def lexical_category_cascade(pos: str) -> List[str]:
+    """The lexical categories tried in order by
+    match_tokens_against_forms_in_wikidata for a spaCy PoS"""
+    candidates = []
+    if pos not in PUNCTUATION_POSTAGS and pos in POSTAG_TO_Q:
+        candidates.append(POSTAG_TO_Q[pos])
+    if pos == "PROPN":
+        candidates.extend([POSTAG_TO_Q["NOUN"], POSTAG_TO_Q["ADJ"]])
+    candidates.extend([POSTAG_TO_Q["NOUN"], POSTAG_TO_Q["VERB"], POSTAG_TO_Q["ADJ"]])
+    cascade: List[str] = []
+    for lexical_category in candidates:
+        if lexical_category not in cascade:
+            cascade.append(lexical_category)
+    return cascade
+
+
+def lookup_forms_batch(
+    iso639: str, pairs: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], List[str]]:
+    """Look up many (representation, lexical category) pairs at once
+
+    Returns the form ids for every requested pair, an empty list means no match"""
+    unique_pairs = list(dict.fromkeys(pairs))
+    if config.lexeme_index_path:
+        logger.debug("Looking up in the offline lexeme index")
+        lexeme_index = get_lexeme_index(index_path=config.lexeme_index_path)
+        return {
+            (representation, lexical_category): lexeme_index.lookup(
+                iso639=iso639,
+                representation=representation,
+                lexical_category=lexical_category,
+            )
+            for representation, lexical_category in unique_pairs
+        }
+    match_cache = get_match_cache()
+    results: Dict[Tuple[str, str], List[str]] = {}
+    if match_cache:
+        results.update(match_cache.get_many(iso639=iso639, pairs=unique_pairs))
+        logger.debug(f"Found {len(results)} pairs in the match cache")
+    missing_pairs = [pair for pair in unique_pairs if pair not in results]
+    for start in range(0, len(missing_pairs), config.sparql_batch_size):
+        end = start + config.sparql_batch_size
+        batch_results = lookup_forms_batch_in_wikidata(
+            iso639=iso639, pairs=missing_pairs[start:end]
+        )
+        if match_cache:
+            match_cache.set_many(iso639=iso639, results=batch_results)
+        results.update(batch_results)
+    return results
+
+
+def spacy_token_to_forms(token: "Token") -> List[str]:
+    """Identify Wikidata lexeme forms from spaCy token.
+
+    The lexical categories of the fallback cascade are looked up in one
+    batch and the forms of the first category that matches are returned.
+    The token is not modified.
 
     Parameters
     ----------
-    token : spacy.tokens.token.Token
+    token : spacy.tokens.token.Token or models.token.LexSrtToken
 
     Returns
     -------
-    lexemes : list of strings
+    forms : list of strings
 
     Examples
     --------
@@ -131,84 +204,70 @@ def spacy_token_to_forms(
     ['L36385']
 
     """
-    POSTAG_TO_Q = {
-        "ADJ": "Q34698",
-        "ADV": "Q380057",
-        "INTJ": "Q83034",
-        "NOUN": "Q1084",
-        "PROPB": "Q147276",
-        "VERB": "Q24905",
-        "ADP": "Q134316",
-        "AUX": "Q24905",
-        "CCONJ": "Q36484",
-        "DET": "Q576271",
-        "NUM": "Q63116",
-        "PART": "Q184943",
-        "PRON": "Q36224",
-        "PROPN": "Q147276",
-        "SCONJ": "Q36484",
-    }
-    if not token:
-        raise MissingInformationError()
-    if lookup_proper_noun_as_noun:
-        POSTAG_TO_Q["PROPN"] = "Q1084"
-    if lookup_proper_noun_as_adjective:
-        POSTAG_TO_Q["PROPN"] = "Q34698"
-    if overwrite_as_noun:
-        token.pos_ = "NOUN"
-    if overwrite_as_verb:
-        token.pos_ = "VERB"
-    if overwrite_as_adjective:
-        token.pos_ = "ADJ"
-    if token.pos_ in ["PUNCT", "SYM", "X"]:
+    if token.pos_ in PUNCTUATION_POSTAGS:
         logger.error(f"PoS '{token.pos_}' is a punctuation, skipping")
         return []
-    # Cleaning
-    if '"' in token.norm_:
-        token.norm_ = token.norm_.replace('"', "")
-    if "-" in token.norm_:
-        token.norm_ = token.norm_.replace("-", "")
-    # logger.info(f"token.norm_: {token.norm_}")
-    # exit()
-
-    iso639 = token.lang_
-    logger.info(f"Detected iso639 language: {iso639}")
-    language = iso639_to_q(iso639)
-    logger.debug(f"Matched language to the following QID: {language}")
-    # if lowercase:
-    #     representation = token.norm_.lower()
-    # else:
-    representation = token.norm_
-    if token.pos_ not in POSTAG_TO_Q:
-        logger.error(f"PoS '{token.pos_}' not supported, skipping")
-        return []
-    lexical_category = POSTAG_TO_Q[token.pos_]
-    logger.info(
-        f"Trying to match token with the representation "
-        f"'{representation}' and lexical category "
-        f"'{lexical_category}' with Wikidata"
+    representation = clean_representation(token.norm_)
+    cascade = lexical_category_cascade(token.pos_)
+    results = lookup_forms_batch(
+        iso639=token.lang_,
+        pairs=[(representation, lexical_category) for lexical_category in cascade],
+    )
+    for lexical_category in cascade:
+        forms = results[(representation, lexical_category)]
+        if forms:
+            return forms
+    return []
+
+
+def build_batch_query(iso639: str, language: str, pairs: List[Tuple[str, str]]) -> str:
+    """Build a query resolving all pairs at once using a VALUES block"""
+    values = "\n               ".join(
+        f'("{escape_string(representation)}"@{iso639} wd:{lexical_category})'
+        for representation, lexical_category in pairs
     )
-    query = """
-       SELECT DISTINCT ?form {{
+    return """
+       SELECT DISTINCT ?representation ?lexical_category ?form {{
+           VALUES (?representation ?lexical_category) {{
+               {values}
+           }}
+           {lexical_category_pattern}
            ?lexeme dct:language wd:{language} ;
-            wikibase:lexicalCategory / wdt:P279* wd:{lexical_category} ;
             ontolex:lexicalForm ?form.
-            ?form ontolex:representation "{representation}"@{iso639} .
+            ?form ontolex:representation ?representation .
     }}""".format(
+        values=values,
+        lexical_category_pattern=build_lexical_category_pattern(
+            dict.fromkeys(lexical_category for _, lexical_category in pairs)
+        ),
         language=language,
-        lexical_category=lexical_category,
-        representation=representation,
-        iso639=iso639,
     )
 
-    logger.debug("Looking up in Wikidata")
-    from wikibaseintegrator.wbi_config import config as wbi_config  # type: ignore
 
-    wbi_config["USER_AGENT"] = "LexSrt/1.0 (https://www.wikidata.org/wiki/User:So9q)"
+def parse_batch_results(
+    data: Dict, pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], List[str]]:
+    """Map the bindings of a batch query back to the requested pairs"""
+    results: Dict[Tuple[str, str], List[str]] = {pair: [] for pair in pairs}
+    for binding in data["results"]["bindings"]:
+        pair = (
+            binding["representation"]["value"],
+            binding["lexical_category"]["value"][31:],
+        )
+        if pair in results:
+            results[pair].append(binding["form"]["value"][31:])
+    return results
+
+
+def lookup_forms_batch_in_wikidata(
+    iso639: str, pairs: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], List[str]]:
+    """Resolve all pairs with one query using a VALUES block"""
+    if not pairs:
+        return {}
+    language = iso639_to_q(iso639)
+    logger.debug(f"Matched language to the following QID: {language}")
+    query = build_batch_query(iso639=iso639, language=language, pairs=pairs)
+    logger.info(f"Looking up {len(pairs)} representations in Wikidata")
     data = execute_sparql_query(query=query)
-    bindings = data["results"]["bindings"]
-    if bindings:
-        forms = [binding["form"]["value"][31:] for binding in bindings]
-        return forms
-    else:
-        return []
+    return parse_batch_results(data=data, pairs=pairs)
@@ -0,0 +1,232 @@
+"""Record and replay every HTTP request LexSrt sends
+
+In record mode the requests go out as usual and every successful response
+is stored in a SQLite archive keyed by method, URL and body. In replay mode
+the responses are served from the archive without any network access and
+a request that was never recorded raises ReplayMissError.
+
+The synchronous calls go through the session of the shared HTTP client
+where an adapter is mounted, the async client of the API gets a transport
+wrapping its own."""
+import hashlib
+import logging
+import os
+import zlib
+from datetime import timedelta
+from typing import ClassVar, Dict, List, Optional, Tuple
+
+import httpx
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import config
+from models.exceptions import ReplayMissError
+from models.http_client import get_http_client
+from models.sqlite_store import SqliteStore, open_store
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+# the stored body is already decoded so these would no longer be true
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+RecordedResponse = Tuple[int, Dict[str, str], bytes]
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL
+);"""
+
+
+class HttpArchive(SqliteStore):
+    description: ClassVar[str] = "HTTP archive"
+    pragmas: ClassVar[List[str]] = []
+    sql_schema: ClassVar[str] = SCHEMA
+
+    @staticmethod
+    def key(method: str, url: str, body: Optional[bytes]) -> str:
+        digest = hashlib.sha256()
+        for part in (method.upper().encode(), url.encode(), body or b""):
+            digest.update(part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[RecordedResponse]:
+        with self._lock:
+            row = self.__connection__.execute(
+                "SELECT status, headers, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        headers = dict(
+            line.split(": ", 1) for line in row[1].splitlines() if ": " in line
+        )
+        return row[0], headers, zlib.decompress(row[2])
+
+    def put(
+        self,
+        key: str,
+        method: str,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+    ):
+        serialized_headers = "\n".join(
+            f"{name}: {value}"
+            for name, value in headers.items()
+            if name.lower() not in SKIPPED_HEADERS
+        )
+        with self._lock:
+            self.__connection__.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, method, url, status, serialized_headers, zlib.compress(body)),
+            )
+            self.__connection__.commit()
+
+
+def get_replayed(
+    archive: HttpArchive, method: str, url: str, key: str
+) -> RecordedResponse:
+    recorded = archive.get(key=key)
+    if recorded is None:
+        raise ReplayMissError(f"No recorded response for {method} {url[:200]}")
+    return recorded
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """Transport adapter for the requests sessions"""
+
+    def __init__(self, archive: HttpArchive, mode: str, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+        self.mode = mode
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:  # type: ignore
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        method = str(request.method)
+        url = str(request.url)
+        key = HttpArchive.key(method=method, url=url, body=body)
+        if self.mode == REPLAY:
+            status, headers, content = get_replayed(
+                archive=self.archive, method=method, url=url, key=key
+            )
+            response = Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response._content = content
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.url = url
+            response.request = request
+            response.reason = "Replayed"
+            response.elapsed = timedelta(0)
+            return response
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            self.archive.put(
+                key=key,
+                method=method,
+                url=url,
+                status=response.status_code,
+                headers=dict(response.headers),
+                body=response.content,
+            )
+        return response
+
+
+class RecordReplayTransport(httpx.AsyncBaseTransport):
+    """Transport for the async client of the API, the responses are
+    returned as streams so the client reads them like network responses"""
+
+    def __init__(
+        self, archive: HttpArchive, mode: str, transport: httpx.AsyncBaseTransport
+    ):
+        self.archive = archive
+        self.mode = mode
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        method = request.method
+        url = str(request.url)
+        key = HttpArchive.key(method=method, url=url, body=body)
+        if self.mode == REPLAY:
+            status, headers, content = get_replayed(
+                archive=self.archive, method=method, url=url, key=key
+            )
+            return httpx.Response(
+                status_code=status,
+                headers=headers,
+                stream=httpx.ByteStream(content),
+                request=request,
+            )
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in SKIPPED_HEADERS
+        }
+        if response.status_code == 200:
+            self.archive.put(
+                key=key,
+                method=method,
+                url=url,
+                status=response.status_code,
+                headers=headers,
+                body=content,
+            )
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=headers,
+            stream=httpx.ByteStream(content),
+            request=request,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def get_http_archive() -> Optional[HttpArchive]:
+    """The archive used by the configured mode or None if it is disabled"""
+    if config.http_archive_mode not in (RECORD, REPLAY) or not config.http_archive_path:
+        return None
+    return open_store(HttpArchive, os.path.expanduser(config.http_archive_path))
+
+
+def install_http_archive():
+    """Mount the adapter on the shared HTTP client according to the config"""
+    http_archive = get_http_archive()
+    if http_archive is None:
+        return
+    print(
+        f"Using the HTTP archive {http_archive.path} in {config.http_archive_mode} mode"
+    )
+    get_http_client().mount(
+        RecordReplayAdapter(
+            archive=http_archive,
+            mode=config.http_archive_mode,
+            pool_connections=config.http_pool_size,
+            pool_maxsize=config.http_pool_size,
+        )
+    )
+
+
+def get_async_transport(
+    transport: httpx.AsyncBaseTransport,
+) -> httpx.AsyncBaseTransport:
+    """Wrap the transport of the async client according to the config"""
+    http_archive = get_http_archive()
+    if http_archive is None:
+        return transport
+    return RecordReplayTransport(
+        archive=http_archive, mode=config.http_archive_mode, transport=transport
+    )
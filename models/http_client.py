@@ -0,0 +1,240 @@
+"""Shared HTTP client for all synchronous requests to WDQS and the Wikibase API
+
+One requests session keeps a pool of keep-alive connections. The number of
+requests in flight is controlled with AIMD like TCP congestion control: it
+grows by about one per round of successful requests and is halved when the
+server answers 429 or 503 or the API reports maxlag or ratelimited.
+Retry-After is honored by pausing all requests, not only the throttled one,
+so throughput stays close to the limit of WDQS without being banned. Other
+server errors, connection errors and timeouts are retried with exponential
+backoff so a single failure does not abort a long run."""
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from pydantic import BaseModel, PrivateAttr
+from requests.adapters import HTTPAdapter
+
+import config
+from models.exceptions import HttpRetryError, WikibaseApiError
+from models.metrics import record_sparql_response, record_wikibase_api_response
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_STATUS_CODES = (429, 503)
+# retried with backoff
+TRANSIENT_STATUS_CODES = (500, 502, 504)
+# MediaWiki API error codes that mean the client should slow down
+THROTTLED_API_ERRORS = ("maxlag", "ratelimited")
+
+
+class AimdLimiter(BaseModel):
+    """Additive increase, multiplicative decrease of the allowed concurrency"""
+
+    min_concurrency: int = config.http_min_concurrency
+    max_concurrency: int = config.http_max_concurrency
+    concurrency: float = float(config.http_max_concurrency)
+    in_flight: int = 0
+    # no request is sent before this time after a throttled response
+    paused_until: float = 0.0
+    _condition: threading.Condition = PrivateAttr(default_factory=threading.Condition)
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.concurrency):
+                    self.in_flight += 1
+                    return
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def increase(self):
+        with self._condition:
+            self.concurrency = min(
+                float(self.max_concurrency), self.concurrency + 1 / self.concurrency
+            )
+            self._condition.notify_all()
+
+    def decrease(self, retry_after: float):
+        with self._condition:
+            now = time.monotonic()
+            # the throttled responses of one burst only halve once
+            if now >= self.paused_until:
+                self.concurrency = max(
+                    float(self.min_concurrency), self.concurrency / 2
+                )
+                logger.warning(
+                    f"Throttled, lowering the concurrency to {int(self.concurrency)} "
+                    f"and pausing for {retry_after} seconds"
+                )
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Retry-After is either seconds or an HTTP date"""
+    if value is None:
+        return float(config.http_default_retry_after)
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return float(config.http_default_retry_after)
+
+
+def get_retry_after(response: requests.Response) -> float:
+    return parse_retry_after(response.headers.get("Retry-After"))
+
+
+def get_backoff(attempt: int) -> float:
+    return min(config.http_max_retry_backoff, config.http_retry_backoff * 2**attempt)
+
+
+def get_api_error_code(response: requests.Response) -> str:
+    """The code of a MediaWiki API error, empty if there is none"""
+    try:
+        json_data = response.json()
+    except ValueError:
+        return ""
+    error = json_data.get("error") if isinstance(json_data, dict) else None
+    return error.get("code", "") if isinstance(error, dict) else ""
+
+
+class HttpClient(BaseModel):
+    session: requests.Session
+    limiter: AimdLimiter
+    timeout: int = config.http_timeout
+    max_retries: int = config.http_max_retries
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def mount(self, adapter: HTTPAdapter):
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __is_throttled__(self, response: requests.Response, api: bool) -> bool:
+        if response.status_code in THROTTLED_STATUS_CODES:
+            return True
+        return api and get_api_error_code(response) in THROTTLED_API_ERRORS
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        record: Callable[[requests.Response], None],
+        api: bool = False,
+        max_retries: Optional[int] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Send the request when the limiter allows it, retry throttled
+        responses after the time the server asked for and server errors,
+        connection errors and timeouts after a growing backoff
+
+        With api the MediaWiki maxlag and ratelimited errors are throttling too"""
+        max_retries = max_retries or self.max_retries
+        problem = ""
+        for attempt in range(max_retries):
+            self.limiter.acquire()
+            try:
+                response = self.session.request(
+                    method, url, timeout=self.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                problem = f"{type(e).__name__}: {e}"
+                response = None
+            finally:
+                self.limiter.release()
+            if response is None:
+                # slept outside the limiter so other requests can go on
+                logger.warning(f"{problem}, retrying {url}")
+                if attempt + 1 < max_retries:
+                    time.sleep(get_backoff(attempt=attempt))
+                continue
+            record(response)
+            if self.__is_throttled__(response=response, api=api):
+                problem = (
+                    "throttling "
+                    f"({get_api_error_code(response) or response.status_code})"
+                )
+                self.limiter.decrease(retry_after=get_retry_after(response))
+                continue
+            if response.status_code in TRANSIENT_STATUS_CODES:
+                problem = f"server error {response.status_code}"
+                logger.warning(f"Got {problem} from {url}, retrying")
+                if attempt + 1 < max_retries:
+                    time.sleep(get_backoff(attempt=attempt))
+                continue
+            self.limiter.increase()
+            response.raise_for_status()
+            return response
+        raise HttpRetryError(
+            f"No result from {url} after {max_retries} attempts, "
+            f"the last one failed with {problem}"
+        )
+
+    def execute_sparql_query(
+        self, query: str, max_retries: Optional[int] = None
+    ) -> Dict[str, Any]:
+        # the endpoints are read from the WikibaseIntegrator config like before
+        from wikibaseintegrator.wbi_config import config as wbi_config  # type: ignore
+
+        response = self.request(
+            "POST",
+            str(wbi_config["SPARQL_ENDPOINT_URL"]),
+            data={"query": query, "format": "json"},
+            record=record_sparql_response,
+            max_retries=max_retries,
+            headers={"Accept": "application/sparql-results+json"},
+        )
+        return response.json()
+
+    def mediawiki_api_call(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        from wikibaseintegrator.wbi_config import config as wbi_config  # type: ignore
+
+        response = self.request(
+            "POST",
+            str(wbi_config["MEDIAWIKI_API_URL"]),
+            record=record_wikibase_api_response,
+            api=True,
+            data={**data, "format": "json"},
+        )
+        json_data = response.json()
+        if "error" in json_data:
+            raise WikibaseApiError(json_data["error"])
+        return json_data
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> HttpClient:
+    """The process-wide client"""
+    session = requests.Session()
+    session.headers["User-Agent"] = config.user_agent
+    http_client = HttpClient(session=session, limiter=AimdLimiter())
+    http_client.mount(
+        HTTPAdapter(
+            pool_connections=config.http_pool_size, pool_maxsize=config.http_pool_size
+        )
+    )
+    return http_client
+
+
+def execute_sparql_query(
+    query: str, max_retries: Optional[int] = None
+) -> Dict[str, Any]:
+    return get_http_client().execute_sparql_query(query=query, max_retries=max_retries)
+
+
+def mediawiki_api_call(data: Dict[str, Any]) -> Dict[str, Any]:
+    return get_http_client().mediawiki_api_call(data=data)
@@ -0,0 +1,91 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List
+
+from pydantic import BaseModel
+
+import config
+from models.http_client import mediawiki_api_call
+
+if TYPE_CHECKING:
+    from wikibaseintegrator.entities import LexemeEntity  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_wbi() -> Any:
+    """The WikibaseIntegrator package takes a quarter of a
+    second to import so it is only imported when needed"""
+    from wikibaseintegrator import WikibaseIntegrator  # type: ignore
+    from wikibaseintegrator.wbi_config import config as wbi_config  # type: ignore
+
+    wbi_config["USER_AGENT"] = config.user_agent
+    return WikibaseIntegrator()
+
+
+class LexemeFetcher(BaseModel):
+    """Fetch many lexemes with as few wbgetentities calls as possible
+
+    Form ids are deduplicated to lexeme ids and up to batch_size
+    entities (50 is the API limit for anonymous users) are requested per call.
+    The batches run concurrently in a bounded thread pool."""
+
+    # WikibaseIntegrator
+    wbi: Any
+    batch_size: int = 50
+    max_workers: int = config.lexeme_fetch_workers
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @staticmethod
+    def get_lexeme_ids(entity_ids: Iterable[str]) -> List[str]:
+        """Deduplicate form or sense ids like L1-F2 to lexeme ids like L1"""
+        return list(dict.fromkeys(entity_id.split("-")[0] for entity_id in entity_ids))
+
+    def fetch_batch_json(self, lexeme_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        logger.debug(f"Fetching {len(lexeme_ids)} lexemes")
+        data = mediawiki_api_call(
+            data={
+                "action": "wbgetentities",
+                "ids": "|".join(lexeme_ids),
+            }
+        )
+        entities = {}
+        for lexeme_id in lexeme_ids:
+            json_data = data["entities"].get(lexeme_id)
+            if json_data is None or "missing" in json_data:
+                logger.error(f"Lexeme {lexeme_id} is missing in Wikidata, skipping")
+                continue
+            entities[lexeme_id] = json_data
+        return entities
+
+    def fetch_json(self, entity_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """The raw entity JSON of the lexemes of the given
+        form or lexeme ids in their original order"""
+        lexeme_ids = self.get_lexeme_ids(entity_ids=entity_ids)
+        batches: List[List[str]] = []
+        for start in range(0, len(lexeme_ids), self.batch_size):
+            end = start + self.batch_size
+            batches.append(lexeme_ids[start:end])
+        print(
+            f"Fetching {len(lexeme_ids)} lexemes from Wikidata "
+            f"in {len(batches)} batches"
+        )
+        entities: Dict[str, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in executor.map(self.fetch_batch_json, batches):
+                entities.update(batch)
+        return entities
+
+    def to_lexeme(self, json_data: Dict[str, Any]) -> "LexemeEntity":
+        return self.wbi.lexeme.new().from_json(json_data=json_data)
+
+    def fetch(self, entity_ids: Iterable[str]) -> List["LexemeEntity"]:
+        """Fetch the lexemes of the given form or lexeme ids in their original order"""
+        return [
+            self.to_lexeme(json_data=json_data)
+            for json_data in self.fetch_json(entity_ids=entity_ids).values()
+        ]
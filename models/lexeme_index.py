@@ -0,0 +1,223 @@
+"""Offline lexeme form index built from the Wikidata lexeme dump
+
+The dump (latest-lexemes.json.gz) is streamed one lexeme at a time and every
+form representation becomes an entry keyed by
+(language code, representation, lexical category).
+The entries are sorted in bounded chunks on disk, merged and written to
+a single file that is memory-mapped and binary searched on lookup.
+
+File layout:
+* records: b"<iso639>\t<representation>\t<lexical category>\t<F1>,<F2>\n"
+  sorted by key
+* offsets: one native unsigned 64-bit integer per record
+* footer: offsets position, number of records and a magic marker"""
+import gzip
+import heapq
+import json
+import logging
+import mmap
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from models.wikidata_tables import lexical_category_subclasses
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LEXSRTIX"
+FOOTER = struct.Struct("<QQ8s")
+
+
+class LexemeIndexBuilder(BaseModel):
+    """Stream a lexeme dump into a compact sorted index file
+
+    Memory use is bounded by chunk_size entries, everything else lives on disk"""
+
+    dump_path: str
+    index_path: str
+    # only index representations in these language codes, empty means all
+    languages: List[str] = list()
+    chunk_size: int = 1_000_000
+    number_of_lexemes: int = 0
+    number_of_entries: int = 0
+    number_of_records: int = 0
+
+    def start(self):
+        print(f"Building lexeme index from {self.dump_path}")
+        with tempfile.TemporaryDirectory() as directory:
+            runs = self.__write_sorted_runs__(directory=directory)
+            self.__merge_runs_into_index__(runs=runs)
+        print(
+            f"Indexed {self.number_of_entries} form representations "
+            f"from {self.number_of_lexemes} lexemes into "
+            f"{self.number_of_records} records in {self.index_path}"
+        )
+
+    def iterate_lexemes(self) -> Iterator[Dict[str, Any]]:
+        """The dump is a JSON array with one lexeme per line"""
+        with gzip.open(self.dump_path, "rt", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip().rstrip(",")
+                if line in ("[", "]", ""):
+                    continue
+                yield json.loads(line)
+
+    def iterate_entries(self) -> Iterator[bytes]:
+        for lexeme in self.iterate_lexemes():
+            self.number_of_lexemes += 1
+            lexical_category = lexeme.get("lexicalCategory", "")
+            for form in lexeme.get("forms", []):
+                for representation in form.get("representations", {}).values():
+                    iso639 = representation["language"]
+                    value = representation["value"]
+                    if self.languages and iso639 not in self.languages:
+                        continue
+                    if "\t" in value or "\n" in value:
+                        logger.debug(f"Skipping unindexable representation {value!r}")
+                        continue
+                    self.number_of_entries += 1
+                    form_id = form["id"]
+                    yield f"{iso639}\t{value}\t{lexical_category}\t{form_id}\n".encode()
+            if self.number_of_lexemes % 100_000 == 0:
+                print(f"Read {self.number_of_lexemes} lexemes")
+
+    def __write_run__(self, entries: List[bytes], directory: str) -> str:
+        entries.sort()
+        with tempfile.NamedTemporaryFile(
+            mode="wb", dir=directory, suffix=".run", delete=False
+        ) as file:
+            file.writelines(entries)
+            return file.name
+
+    def __write_sorted_runs__(self, directory: str) -> List[str]:
+        runs = []
+        entries: List[bytes] = []
+        for entry in self.iterate_entries():
+            entries.append(entry)
+            if len(entries) >= self.chunk_size:
+                runs.append(self.__write_run__(entries=entries, directory=directory))
+                entries = []
+        if entries:
+            runs.append(self.__write_run__(entries=entries, directory=directory))
+        return runs
+
+    def __merge_runs_into_index__(self, runs: List[str]):
+        offsets = array("Q")
+        files = [open(run, "rb") for run in runs]
+        try:
+            with open(self.index_path, "wb") as index:
+                position = 0
+                current_key: Optional[bytes] = None
+                form_ids: List[bytes] = []
+                # tab sorts before every printable character so sorting whole
+                # entries gives the same order as sorting the keys
+                for entry in heapq.merge(*files):
+                    key, _, form_id = entry.rstrip(b"\n").rpartition(b"\t")
+                    if key != current_key:
+                        if current_key is not None:
+                            position += self.__write_record__(
+                                index=index, key=current_key, form_ids=form_ids
+                            )
+                        offsets.append(position)
+                        current_key = key
+                        form_ids = []
+                    if form_id not in form_ids:
+                        form_ids.append(form_id)
+                if current_key is not None:
+                    position += self.__write_record__(
+                        index=index, key=current_key, form_ids=form_ids
+                    )
+                index.write(offsets.tobytes())
+                index.write(FOOTER.pack(position, len(offsets), MAGIC))
+        finally:
+            for file in files:
+                file.close()
+        self.number_of_records = len(offsets)
+
+    @staticmethod
+    def __write_record__(index, key: bytes, form_ids: List[bytes]) -> int:
+        record = key + b"\t" + b",".join(form_ids) + b"\n"
+        index.write(record)
+        return len(record)
+
+
+class LexemeIndex(BaseModel):
+    """Read-only memory-mapped view of an index built by LexemeIndexBuilder"""
+
+    index_path: str
+    data: Optional[mmap.mmap] = None
+    offsets: Optional[memoryview] = None
+    number_of_records: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def open(self):
+        with open(self.index_path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_position = len(self.data) - FOOTER.size
+        offsets_position, self.number_of_records, magic = FOOTER.unpack(
+            self.data[footer_position:]
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{self.index_path} is not a LexSrt lexeme index")
+        offsets_end = offsets_position + 8 * self.number_of_records
+        self.offsets = memoryview(self.data)[offsets_position:offsets_end].cast("Q")
+        logger.info(
+            f"Opened lexeme index {self.index_path} "
+            f"with {self.number_of_records} records"
+        )
+
+    def __record_at__(self, position: int) -> bytes:
+        if self.data is None or self.offsets is None:
+            raise ValueError("The lexeme index has not been opened")
+        start = self.offsets[position]
+        end = self.data.find(b"\n", start)
+        return self.data[start:end]
+
+    def __key_at__(self, position: int) -> bytes:
+        return self.__record_at__(position).rpartition(b"\t")[0]
+
+    def lookup(
+        self, iso639: str, representation: str, lexical_category: str
+    ) -> List[str]:
+        """Return the form ids of the lexical category and its subclasses
+        if they are known from the precomputed table, otherwise only the
+        forms of exactly this lexical category are returned"""
+        form_ids: List[str] = []
+        for category in lexical_category_subclasses(lexical_category) or [
+            lexical_category
+        ]:
+            form_ids.extend(
+                self.__lookup_exactly__(
+                    iso639=iso639,
+                    representation=representation,
+                    lexical_category=category,
+                )
+            )
+        return form_ids
+
+    def __lookup_exactly__(
+        self, iso639: str, representation: str, lexical_category: str
+    ) -> List[str]:
+        key = f"{iso639}\t{representation}\t{lexical_category}".encode()
+        position = bisect_left(range(self.number_of_records), key, key=self.__key_at__)
+        if position == self.number_of_records:
+            return []
+        record_key, _, form_ids = self.__record_at__(position).rpartition(b"\t")
+        if record_key != key:
+            return []
+        return form_ids.decode().split(",")
+
+
+@lru_cache(maxsize=8)
+def get_lexeme_index(index_path: str) -> LexemeIndex:
+    """Open each index once per process"""
+    lexeme_index = LexemeIndex(index_path=index_path)
+    lexeme_index.open()
+    return lexeme_index
@@ -0,0 +1,164 @@
+"""Local store of lexeme entities that only downloads what changed
+
+Every stored lexeme keeps its lastrevid. Before reusing the stored JSON the
+revisions are checked in bulk with a lightweight prop=info query and only
+new or changed lexemes are downloaded again with wbgetentities."""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, Iterable, List, Optional
+
+from pydantic import Field
+
+import config
+from models.http_client import mediawiki_api_call
+from models.lexeme_fetcher import LexemeFetcher, get_wbi
+from models.metrics import cache_lookups
+from models.sqlite_store import SqliteStore, get_store
+
+if TYPE_CHECKING:
+    from wikibaseintegrator.entities import LexemeEntity  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS lexemes (
+    id TEXT PRIMARY KEY,
+    lastrevid INTEGER NOT NULL,
+    json TEXT NOT NULL,
+    checked REAL NOT NULL
+);"""
+
+
+class LexemeStore(SqliteStore):
+    fetcher: LexemeFetcher = Field(default_factory=lambda: LexemeFetcher(wbi=get_wbi()))
+    # stored lexemes checked more recently than this many seconds are trusted
+    revalidate_after: int = config.lexeme_store_revalidate_after
+    number_of_downloads: int = 0
+
+    description: ClassVar[str] = "lexeme store"
+    sql_schema: ClassVar[str] = SCHEMA
+
+    def __load__(self, lexeme_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored rows with lastrevid and checked time"""
+        rows = {}
+        with self._lock:
+            for lexeme_id in lexeme_ids:
+                row = self.__connection__.execute(
+                    "SELECT lastrevid, json, checked FROM lexemes WHERE id = ?",
+                    (lexeme_id,),
+                ).fetchone()
+                if row is not None:
+                    rows[lexeme_id] = {
+                        "lastrevid": row[0],
+                        "json": row[1],
+                        "checked": row[2],
+                    }
+        return rows
+
+    def __save__(self, entities: Dict[str, Dict[str, Any]]):
+        now = time.time()
+        with self._lock:
+            self.__connection__.executemany(
+                "INSERT OR REPLACE INTO lexemes VALUES (?, ?, ?, ?)",
+                [
+                    (lexeme_id, int(json_data["lastrevid"]), json.dumps(json_data), now)
+                    for lexeme_id, json_data in entities.items()
+                ],
+            )
+            self.__connection__.commit()
+
+    def __mark_checked__(self, lexeme_ids: List[str]):
+        now = time.time()
+        with self._lock:
+            self.__connection__.executemany(
+                "UPDATE lexemes SET checked = ? WHERE id = ?",
+                [(now, lexeme_id) for lexeme_id in lexeme_ids],
+            )
+            self.__connection__.commit()
+
+    @staticmethod
+    def fetch_revisions_batch(lexeme_ids: List[str]) -> Dict[str, int]:
+        """Only the current revision ids, no entity content is downloaded"""
+        data = mediawiki_api_call(
+            data={
+                "action": "query",
+                "prop": "info",
+                "titles": "|".join(f"Lexeme:{lexeme_id}" for lexeme_id in lexeme_ids),
+            }
+        )
+        revisions = {}
+        for page in data["query"]["pages"].values():
+            if "lastrevid" in page:
+                revisions[page["title"].split(":", 1)[1]] = int(page["lastrevid"])
+        return revisions
+
+    def fetch_revisions(self, lexeme_ids: List[str]) -> Dict[str, int]:
+        batch_size = self.fetcher.batch_size
+        batches: List[List[str]] = []
+        for start in range(0, len(lexeme_ids), batch_size):
+            end = start + batch_size
+            batches.append(lexeme_ids[start:end])
+        revisions: Dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=self.fetcher.max_workers) as executor:
+            for batch in executor.map(self.fetch_revisions_batch, batches):
+                revisions.update(batch)
+        return revisions
+
+    def fetch(self, entity_ids: Iterable[str]) -> List["LexemeEntity"]:
+        """Same interface as LexemeFetcher.fetch but served from the store"""
+        lexeme_ids = LexemeFetcher.get_lexeme_ids(entity_ids=entity_ids)
+        stored = self.__load__(lexeme_ids=lexeme_ids)
+        now = time.time()
+        to_check = [
+            lexeme_id
+            for lexeme_id, row in stored.items()
+            if now - row["checked"] > self.revalidate_after
+        ]
+        stale = []
+        if to_check:
+            print(f"Checking the revisions of {len(to_check)} stored lexemes")
+            revisions = self.fetch_revisions(lexeme_ids=to_check)
+            stale = [
+                lexeme_id
+                for lexeme_id in to_check
+                if revisions.get(lexeme_id) != stored[lexeme_id]["lastrevid"]
+            ]
+            self.__mark_checked__(
+                lexeme_ids=[
+                    lexeme_id for lexeme_id in to_check if lexeme_id not in stale
+                ]
+            )
+        to_download = [
+            lexeme_id
+            for lexeme_id in lexeme_ids
+            if lexeme_id not in stored or lexeme_id in stale
+        ]
+        print(
+            f"Found {len(lexeme_ids) - len(to_download)} of {len(lexeme_ids)} "
+            f"lexemes up to date in the lexeme store"
+        )
+        cache_lookups.inc(
+            len(lexeme_ids) - len(to_download), cache="lexeme_store", result="hit"
+        )
+        cache_lookups.inc(len(to_download), cache="lexeme_store", result="miss")
+        downloaded: Dict[str, Dict[str, Any]] = {}
+        if to_download:
+            downloaded = self.fetcher.fetch_json(entity_ids=to_download)
+            self.number_of_downloads += len(downloaded)
+            self.__save__(entities=downloaded)
+        lexemes = []
+        for lexeme_id in lexeme_ids:
+            if lexeme_id in downloaded:
+                json_data = downloaded[lexeme_id]
+            elif lexeme_id in stored and lexeme_id not in stale:
+                json_data = json.loads(stored[lexeme_id]["json"])
+            else:
+                continue
+            lexemes.append(self.fetcher.to_lexeme(json_data=json_data))
+        return lexemes
+
+
+def get_lexeme_store() -> Optional[LexemeStore]:
+    """The process-wide lexeme store or None if it is disabled in the config"""
+    return get_store(LexemeStore, config.lexeme_store_path)
@@ -0,0 +1,773 @@
+"""The CLI pipeline
+
+spaCy, pandas and WikibaseIntegrator are imported where they are first
+used so --help and runs that fail early do not wait for them."""
+import logging
+import urllib
+from argparse import ArgumentParser
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from pydantic import BaseModel
+from srt import Subtitle, parse, timedelta_to_srt_timestamp  # type: ignore
+
+import config
+from models import cleaning
+from models.corpus_index import Segment, get_corpus_index
+from models.exceptions import LanguageCodeError
+from models.export import (
+    EXPORT_FORMATS,
+    LEXEME_REPORT,
+    MATCH_ERROR_REPORT,
+    OCCURRENCE_REPORT,
+    check_export_format,
+    get_row_writer,
+    write_report,
+)
+from models.lexeme_fetcher import LexemeFetcher, get_wbi
+from models.lexeme_store import LexemeStore, get_lexeme_store
+from models.run_journal import RunJournal
+from models.spacy_model_registry import spacy_models
+from models.srt_stream import (
+    batched,
+    iterate_subtitles,
+    iterate_without_commercial_and_credits,
+    remove_commercial_and_credits,
+)
+from models.token import LexSrtToken, match_tokens_against_forms_in_wikidata
+from models.token_cache import tokenize
+from models.tokenized_sentence import TokenizedSentence
+
+if TYPE_CHECKING:
+    from spacy.tokens import Token
+    from wikibaseintegrator.entities import LexemeEntity  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class LexSrt(BaseModel):
+    """
+    srt is a bunch of lines read from the file
+    # pseudo code
+    # accept srt on command line
+    # parse srt
+    # parse into sentences with tokens
+    # extract all tokens
+    # remove duplicate tokens
+    # filter tokens according to the minimum characters
+    # find lexemes for each token
+    # output to dataframe
+    # export to csv or another format
+    """
+
+    srt_lines: str = ""
+    srt_contents: List[str] = list()
+    subtitles: List[Subtitle] = list()
+    tokenized_sentences: List[TokenizedSentence] = list()
+    filename: str = ""
+    forms: List[str] = list()
+    tokens_above_minimum_length: List[LexSrtToken] = list()
+    # the token that was matched for every unique text and PoS
+    matched_tokens: Dict[Tuple[str, str], LexSrtToken] = dict()
+    # LexemeEntity and DataFrame, Any avoids importing them with the module
+    unique_wbi_lexemes: List[Any] = list()
+    lexeme_dataframe: Any = None
+    match_error_dataframe: Any = None
+    language_code: str = ""
+    spacy_model: str = ""
+    encoding: str = "utf-8"
+    batch_size: int = config.spacy_batch_size
+    n_process: int = config.spacy_n_process
+    corpus_processes: int = config.corpus_processes
+    stream: bool = False
+    corpus: str = ""
+    output_directory: str = "."
+    window_size: int = config.stream_window_size
+    resume: bool = False
+    journal: Optional[RunJournal] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def start(self):
+        self.setup_argparse_and_get_filename()
+        self.check_language_code()
+        check_export_format(config.export_format)
+        # imported here because it imports httpx for the API
+        from models.http_archive import install_http_archive
+
+        install_http_archive()
+        if self.corpus:
+            # imported here because the corpus workers import this package
+            from models.corpus import LexSrtCorpus
+
+            LexSrtCorpus(
+                pattern=self.corpus,
+                language_code=self.language_code,
+                spacy_model=self.spacy_model,
+                encoding=self.encoding,
+                output_directory=self.output_directory,
+                processes=self.corpus_processes,
+            ).start()
+            return
+        if self.stream:
+            self.process_as_stream()
+            return
+        self.read_srt_file()
+        self.get_srt_content_and_remove_commercial()
+        self.get_spacy_tokens()
+        self.open_journal()
+        try:
+            self.extract_lexemes_based_on_tokens()
+            self.get_unique_wbi_lexemes()
+        except BaseException:
+            print("Interrupted, run again with --resume to continue from the journal")
+            self.journal.close(completed=False)
+            raise
+        self.journal.close(completed=True)
+        self.print_all_unique_wbi_lexemes()
+        self.print_number_of_unique_lexemes_with_no_senses()
+        self.create_lexeme_dataframe()
+        self.create_match_error_dataframe()
+        self.write_reports()
+        self.add_to_corpus_index()
+
+    def check_language_code(self):
+        if not 2 <= len(self.language_code) <= 3:
+            raise LanguageCodeError(
+                "The language code was not a supported length of 2-3 characters"
+            )
+
+    def read_srt_file(self):
+        """Open and read the SRT file with a specific encoding (e.g., 'latin-1')"""
+        try:
+            with open(self.filename, encoding=self.encoding) as file:
+                self.srt_lines = file.read()
+        except UnicodeDecodeError:
+            print(
+                f"Failed to decode the file using '{self.encoding}' encoding. "
+                f"Try adding --encoding 'latin-1' to the command line"
+            )
+
+    def setup_argparse_and_get_filename(self):
+        parser = ArgumentParser(
+            description="Read and process SRT files from the command line."
+        )
+        parser.add_argument(
+            "--file-encoding",
+            required=False,
+            help="Force a certain file encoding of the SRT file, e.g. 'latin-1'",
+            default="utf-8",
+        )
+        inputs = parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument("-i", "--input", help="Input SRT file name")
+        inputs.add_argument(
+            "-c",
+            "--corpus",
+            help="Directory or glob pattern of SRT files processed in parallel",
+        )
+        parser.add_argument(
+            "-o",
+            "--output-dir",
+            default=".",
+            help="Directory the reports are written to",
+        )
+        parser.add_argument(
+            "--format",
+            choices=EXPORT_FORMATS,
+            default=config.export_format,
+            help="Format of the reports, parquet and arrow need pyarrow",
+        )
+        parser.add_argument(
+            "-l", "--lang", required=True, help="Wikimedia supported language code"
+        )
+        parser.add_argument(
+            "-m",
+            "--spacy_model",
+            required=True,
+            help="spaCy NLP language model, e.g. 'en_core_web_sm'",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=config.spacy_batch_size,
+            help="Number of subtitles spaCy tokenizes per batch",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Number of processes used for tokenization or for the files "
+            "in corpus mode, -1 uses all cores. Defaults to 1 for a single file "
+            "and to all cores in corpus mode",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Process the file as a stream with bounded memory, "
+            "the CSV rows are written in the order they are found",
+        )
+        parser.add_argument(
+            "--lexeme-index",
+            required=False,
+            help="Match forms offline using an index built with build_lexeme_index.py",
+            default=config.lexeme_index_path,
+        )
+        parser.add_argument(
+            "--match-cache",
+            required=False,
+            help="Path to the persistent match cache, an empty string disables it",
+            default=config.match_cache_path,
+        )
+        parser.add_argument(
+            "--token-cache",
+            required=False,
+            help="Path to the persistent token cache, an empty string disables it",
+            default=config.token_cache_path,
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue an interrupted run from the journal in the output directory",
+        )
+        parser.add_argument(
+            "--corpus-index",
+            required=False,
+            help="Add the counts of every file to this corpus index and write "
+            "the corpus reports from it, unchanged files are skipped in corpus mode",
+            default=config.corpus_index_path,
+        )
+        parser.add_argument(
+            "--lexeme-store",
+            required=False,
+            help="Path to the local lexeme store, an empty string disables it",
+            default=config.lexeme_store_path,
+        )
+        http_archive = parser.add_mutually_exclusive_group()
+        http_archive.add_argument(
+            "--record",
+            metavar="ARCHIVE",
+            help="Record all HTTP responses to this archive",
+        )
+        http_archive.add_argument(
+            "--replay",
+            metavar="ARCHIVE",
+            help="Serve all HTTP requests from an archive made with --record",
+        )
+        args = parser.parse_args()
+
+        self.filename = args.input or ""
+        self.corpus = args.corpus or ""
+        self.output_directory = args.output_dir
+        config.export_format = args.format
+        self.language_code = args.lang
+        self.spacy_model = args.spacy_model
+        self.encoding = args.file_encoding
+        self.batch_size = args.batch_size
+        if args.processes is not None:
+            self.n_process = args.processes
+            self.corpus_processes = args.processes
+        self.stream = args.stream
+        self.resume = args.resume
+        config.lexeme_index_path = args.lexeme_index
+        config.match_cache_path = args.match_cache
+        config.token_cache_path = args.token_cache
+        config.lexeme_store_path = args.lexeme_store
+        config.corpus_index_path = args.corpus_index
+        if args.record:
+            config.http_archive_mode = "record"
+            config.http_archive_path = args.record
+        elif args.replay:
+            config.http_archive_mode = "replay"
+            config.http_archive_path = args.replay
+
+    def get_srt_content_and_remove_commercial(self):
+        """Get the contents as a list of strings"""
+        logger.debug("get_srt_content_and_remove_commercial: running")
+        # Parse the SRT content into a list of subtitle objects
+        subtitles = list(parse(self.srt_lines))
+
+        # Get all the content
+        for subtitle in subtitles:
+            self.srt_contents.append(subtitle.content)
+
+        self.srt_contents = remove_commercial_and_credits(self.srt_contents)
+        # only trailing cues are removed so the rest line up with the contents
+        self.subtitles = subtitles[: len(self.srt_contents)]
+
+        # debug
+        # print(self.srt_contents)
+
+    def get_lexeme_row(self, lexeme: "LexemeEntity") -> Dict[str, Any]:
+        from models.srt_lexeme_entity import SrtLexemeEntity
+
+        srt_lexeme = SrtLexemeEntity(lexeme=lexeme, language_code=self.language_code)
+        return {
+            "id": lexeme.id,
+            "localized lemma": srt_lexeme.get_cleaned_localized_lemma(),
+            "localized senses": srt_lexeme.localized_glosses_as_text(),
+            "has at least one sense": bool(lexeme.senses),
+            "url": lexeme.get_entity_url(),
+        }
+
+    @staticmethod
+    def get_match_error_row(token: LexSrtToken) -> Dict[str, Any]:
+        quoted_token_representation = urllib.parse.quote(token.norm_.lower())
+        return {
+            "text": token.text,
+            "ordia url": f"https://ordia.toolforge.org/search?q={quoted_token_representation}",
+            "google url": f"https://google.com?q={quoted_token_representation}",
+        }
+
+    def create_lexeme_dataframe(self):
+        from pandas import DataFrame
+
+        data = []
+
+        for lexeme in self.unique_wbi_lexemes:
+            data.append(self.get_lexeme_row(lexeme=lexeme))
+        if not data:
+            return
+        df = DataFrame(data)
+        # Sort the DataFrame by the 'localized lemma' column in ascending order
+        df_sorted = df.sort_values(by="localized lemma")
+
+        # Optionally, reset the index to have consecutive row numbers
+        df_sorted.reset_index(drop=True, inplace=True)
+
+        # Create a DataFrame from the list of dictionaries
+        self.lexeme_dataframe = df_sorted
+
+        # debug
+        print(self.lexeme_dataframe)
+
+    def create_match_error_dataframe(self):
+        from pandas import DataFrame
+
+        data = []
+
+        for token in self.tokens_with_match_error:
+            data.append(self.get_match_error_row(token=token))
+        if not data:
+            return
+        df = DataFrame(data)
+        # Sort the DataFrame by the 'localized lemma' column in ascending order
+        df_sorted = df.sort_values(by="text")
+
+        # Optionally, reset the index to have consecutive row numbers
+        df_sorted.reset_index(drop=True, inplace=True)
+
+        # Create a DataFrame from the list of dictionaries
+        self.match_error_dataframe = df_sorted
+
+        # debug
+        print(self.match_error_dataframe)
+
+    @staticmethod
+    def clean_sentence(sentence: str) -> str:
+        return cleaning.clean_sentence(sentence)
+
+    @staticmethod
+    def filter_tokens(tokens):
+        """Filter the tokens to remove junk like emails"""
+        return cleaning.filter_tokens(tokens)
+
+    @staticmethod
+    def convert_to_lexsrttoken(tokens: List["Token"]) -> List[LexSrtToken]:
+        """Copy the needed attributes so the spaCy Doc is not kept alive"""
+        return [LexSrtToken.from_spacy_token(token=token) for token in tokens]
+
+    def get_spacy_tokens(self):
+        logger.debug("get_spacy_tokens: running")
+        print("Tokenizing all subtitle sentences")
+        nlp = spacy_models.get(spacy_model=self.spacy_model)
+        cleaned_sentences = cleaning.clean_sentences(self.srt_contents)
+        tokenized = tokenize(
+            nlp=nlp,
+            sentences=cleaned_sentences,
+            batch_size=self.batch_size,
+            n_process=self.n_process,
+        )
+
+        for sentence, compact_tokens in zip(cleaned_sentences, tokenized):
+            # every cue gets its own tokens because matching mutates them
+            lexsrttokens = [LexSrtToken(*token) for token in compact_tokens]
+            self.tokenized_sentences.append(
+                TokenizedSentence(
+                    sentence=sentence,
+                    tokens=lexsrttokens,
+                )
+            )
+            for token in lexsrttokens:
+                if len(token.text) > config.minimum_token_length:
+                    self.tokens_above_minimum_length.append(token)
+
+        print(
+            f"Found {len(self.tokenized_sentences)} subtitles "
+            f"with a total of {self.number_of_tokens_found} tokens"
+        )
+        print(
+            f"Found {self.count_tokens_above_minimum_length} "
+            f"tokens longer than the minimum token "
+            f"length ({config.minimum_token_length})"
+        )
+        # debug
+        # print(f"Number of sentences found: {len(self.tokenized_sentences)}")
+        # for ts in self.tokenized_sentences:
+        #     print(ts)
+
+    @property
+    def count_tokens_above_minimum_length(self) -> int:
+        return sum(
+            [
+                sentence.number_of_tokens_longer_than_minimum_length
+                for sentence in self.tokenized_sentences
+            ]
+        )
+
+    # def extract_lexemes_based_on_sentences(self):
+    #     logger.debug("get_lexemes: running")
+    #     if not self.lexemes:
+    #         for ts in self.tokenized_sentences:
+    #             lexemes = ts.convert_tokens_to_lexemes()
+    #             if lexemes:
+    #                 self.lexemes.extend(lexemes)
+    #     print(f"Found {len(self.lexemes)} lexemes based on the tokens")
+
+    # noinspection PyTypeChecker
+    def extract_lexemes_based_on_tokens(self):
+        logger.debug("extract_lexemes_based_on_tokens: running")
+        print("Matching tokes against lexeme forms in Wikidata")
+        if self.tokens_above_minimum_length and not self.forms:
+            # try deduplicating, in the order the tokens were found
+            # so the queries are the same every run
+            unique_tokens = list(dict.fromkeys(self.tokens_above_minimum_length))
+            # keyed by the text and PoS spaCy found, like the occurrences
+            self.matched_tokens = {
+                (token.text, token.spacy_lexical_category): token
+                for token in unique_tokens
+            }
+            self.match_tokens_and_record_them()
+            for token in unique_tokens:
+                if token.forms:
+                    self.forms.extend(token.forms)
+        print(f"Found {len(self.forms)} forms based on the tokens")
+
+    # def get_lexemes_and_print_senses(self):
+    #     logger.debug("get_lexeme_ids: running")
+    #     for ts in self.tokenized_sentences:
+    #         ts.convert_tokens_to_lexemes()
+    #         print(ts)
+    #         print(f"lexemes: {ts.lexemes}")
+    #         for lexeme in ts.get_wbi_lexemes():
+    #             lexeme: Lexeme
+    #             print(f"{get_cleaned_localized_lemma(lexeme=lexeme)}: "
+    #                   f"{localized_glosses_as_text(lexeme=lexeme)}"
+    #                   f"\n More details: {lexeme.get_entity_url()}")
+    #         exit()
+
+    def match_tokens_and_record_them(self):
+        """Match the tokens in chunks and record every chunk in the journal,
+        tokens recorded by an interrupted run get their forms from it"""
+        if self.journal is None:
+            match_tokens_against_forms_in_wikidata(
+                tokens=list(self.matched_tokens.values())
+            )
+            return
+        pending = [
+            key
+            for key, token in self.matched_tokens.items()
+            if not self.journal.restore_match(key=key, token=token)
+        ]
+        for keys in batched(pending, config.journal_chunk_size):
+            match_tokens_against_forms_in_wikidata(
+                tokens=[self.matched_tokens[key] for key in keys]
+            )
+            self.journal.record_matches(
+                matched_tokens={key: self.matched_tokens[key] for key in keys}
+            )
+
+    def get_unique_wbi_lexemes(self):
+        logger.debug("get_unique_wbi_lexemes: running")
+        unique_lexeme_ids = LexemeFetcher.get_lexeme_ids(entity_ids=self.forms)
+        print(f"Found {len(unique_lexeme_ids)} unique lexemes")
+        fetcher = self.get_lexeme_fetcher()
+        if self.journal is None:
+            self.unique_wbi_lexemes.extend(fetcher.fetch(entity_ids=unique_lexeme_ids))
+            return
+        journaled = self.journal.lexemes
+        pending = [
+            lexeme_id for lexeme_id in unique_lexeme_ids if lexeme_id not in journaled
+        ]
+        fetched: Dict[str, Any] = {}
+        for lexeme_ids in batched(pending, config.journal_chunk_size):
+            lexemes = fetcher.fetch(entity_ids=lexeme_ids)
+            self.journal.record_lexemes(lexemes=lexemes)
+            fetched.update((lexeme.id, lexeme) for lexeme in lexemes)
+        # the same order as without the journal
+        to_lexeme = LexemeFetcher(wbi=get_wbi()).to_lexeme
+        for lexeme_id in unique_lexeme_ids:
+            if lexeme_id in fetched:
+                self.unique_wbi_lexemes.append(fetched[lexeme_id])
+            elif lexeme_id in journaled:
+                self.unique_wbi_lexemes.append(
+                    to_lexeme(json_data=journaled[lexeme_id])
+                )
+
+    def open_journal(self):
+        self.journal = RunJournal.for_run(
+            output_directory=self.output_directory,
+            filename=self.filename,
+            language_code=self.language_code,
+            spacy_model=self.spacy_model,
+        )
+        self.journal.open(resume=self.resume)
+
+    @staticmethod
+    def get_lexeme_fetcher() -> Union[LexemeStore, LexemeFetcher]:
+        """The lexeme store if enabled, otherwise download everything"""
+        return get_lexeme_store() or LexemeFetcher(wbi=get_wbi())
+
+    def print_all_unique_wbi_lexemes(self):
+        logger.debug("print_all_unique_wbi_lexemes: running")
+        from models.srt_lexeme_entity import SrtLexemeEntity
+
+        for wbi_lexeme in self.unique_wbi_lexemes:
+            srt_lexeme = SrtLexemeEntity(
+                lexeme=wbi_lexeme, language_code=self.language_code
+            )
+            print(
+                f"{srt_lexeme.get_cleaned_localized_lemma()}: "
+                f"{srt_lexeme.localized_glosses_as_text()}"
+                f"\n More details: {wbi_lexeme.get_entity_url()}"
+            )
+
+    @property
+    def number_of_tokens_found(self) -> int:
+        return sum([sentence.number_of_tokens for sentence in self.tokenized_sentences])
+
+    @property
+    def number_of_lexemes_with_no_senses(self) -> int:
+        count = 0
+        for lexeme in self.unique_wbi_lexemes:
+            if not lexeme.senses:
+                count += 1
+        return count
+
+    def print_number_of_unique_lexemes_with_no_senses(self):
+        print(
+            f"{self.number_of_lexemes_with_no_senses} "
+            f"lexemes are missing at least one sense"
+        )
+
+    def process_as_stream(self):
+        """Move the cues through cleaning, tokenization, matching and
+        output as a generator pipeline. Only one window of cues and the
+        already seen tokens and lexemes are kept in memory."""
+        logger.debug("process_as_stream: running")
+        print(f"Processing {self.filename} as a stream")
+        nlp = spacy_models.get(spacy_model=self.spacy_model)
+        subtitles = iterate_without_commercial_and_credits(
+            iterate_subtitles(filename=self.filename, encoding=self.encoding)
+        )
+        lexeme_writer = get_row_writer(
+            output_directory=self.output_directory, report=LEXEME_REPORT
+        )
+        match_error_writer = get_row_writer(
+            output_directory=self.output_directory, report=MATCH_ERROR_REPORT
+        )
+        occurrence_writer = get_row_writer(
+            output_directory=self.output_directory, report=OCCURRENCE_REPORT
+        )
+        fetcher = self.get_lexeme_fetcher()
+        corpus_index = get_corpus_index()
+        segment = self.get_segment()
+        # the matched token of every text and PoS, repeats reuse its forms
+        seen_tokens: Dict[Tuple[str, str], LexSrtToken] = {}
+        seen_lexeme_ids: Set[str] = set()
+        number_of_subtitles = number_of_tokens = number_of_lexemes_with_no_senses = 0
+        try:
+            for window in batched(subtitles, self.window_size):
+                new_tokens = []
+                occurrences = []
+                # the cues go through the token cache like in get_spacy_tokens
+                tokenized = tokenize(
+                    nlp=nlp,
+                    sentences=cleaning.clean_sentences(
+                        subtitle.content for subtitle in window
+                    ),
+                    batch_size=self.batch_size,
+                    n_process=self.n_process,
+                )
+                for subtitle, compact_tokens in zip(window, tokenized):
+                    number_of_subtitles += 1
+                    tokens = [LexSrtToken(*token) for token in compact_tokens]
+                    number_of_tokens += len(tokens)
+                    for token in tokens:
+                        if len(token.text) <= config.minimum_token_length:
+                            continue
+                        key = (token.text, token.spacy_lexical_category)
+                        occurrences.append((subtitle, key))
+                        if key not in seen_tokens:
+                            seen_tokens[key] = token
+                            new_tokens.append(token)
+                if new_tokens:
+                    match_tokens_against_forms_in_wikidata(tokens=new_tokens)
+                for subtitle, key in occurrences:
+                    row = self.get_occurrence_row(
+                        subtitle=subtitle,
+                        text=key[0],
+                        pos=key[1],
+                        token=seen_tokens[key],
+                    )
+                    occurrence_writer.write(row=row)
+                    segment.add_occurrence(
+                        text=key[0], norm=seen_tokens[key].norm_, forms=row["forms"]
+                    )
+                if not new_tokens:
+                    continue
+                new_lexeme_ids = [
+                    lexeme_id
+                    for lexeme_id in LexemeFetcher.get_lexeme_ids(
+                        entity_ids=[
+                            form for token in new_tokens for form in token.forms
+                        ]
+                    )
+                    if lexeme_id not in seen_lexeme_ids
+                ]
+                seen_lexeme_ids.update(new_lexeme_ids)
+                for lexeme in fetcher.fetch(entity_ids=new_lexeme_ids):
+                    if not lexeme.senses:
+                        number_of_lexemes_with_no_senses += 1
+                    row = self.get_lexeme_row(lexeme=lexeme)
+                    lexeme_writer.write(row=row)
+                    segment.add_lexeme_row(row=row)
+                for token in new_tokens:
+                    if token.match_error:
+                        match_error_writer.write(
+                            row=self.get_match_error_row(token=token)
+                        )
+        finally:
+            lexeme_writer.close()
+            match_error_writer.close()
+            occurrence_writer.close()
+        print(
+            f"Found {number_of_subtitles} subtitles "
+            f"with a total of {number_of_tokens} tokens"
+        )
+        print(
+            f"Wrote {lexeme_writer.number_of_rows} lexemes, "
+            f"{match_error_writer.number_of_rows} match errors and "
+            f"{occurrence_writer.number_of_rows} occurrences"
+        )
+        print(
+            f"{number_of_lexemes_with_no_senses} "
+            f"lexemes are missing at least one sense"
+        )
+        if corpus_index is not None:
+            segment.number_of_subtitles = number_of_subtitles
+            segment.number_of_tokens = number_of_tokens
+            corpus_index.add_segment(segment=segment)
+            corpus_index.write_reports(
+                language_code=self.language_code,
+                output_directory=self.output_directory,
+            )
+
+    @staticmethod
+    def get_occurrence_row(
+        subtitle: Subtitle, text: str, pos: str, token: LexSrtToken
+    ) -> Dict[str, Any]:
+        """The text and PoS are the ones spaCy found in the cue
+        and the forms come from the token that was matched"""
+        return {
+            "cue index": subtitle.index,
+            "start": timedelta_to_srt_timestamp(subtitle.start),
+            "end": timedelta_to_srt_timestamp(subtitle.end),
+            "text": text,
+            "pos": pos,
+            "forms": list(token.forms),
+        }
+
+    def iterate_occurrences(
+        self,
+    ) -> Iterator[Tuple[Subtitle, Tuple[str, str], LexSrtToken]]:
+        """The cue, text and PoS of every token longer than the minimum
+        length and the token that was matched for that text and PoS"""
+        for subtitle, tokenized_sentence in zip(
+            self.subtitles, self.tokenized_sentences
+        ):
+            for token in tokenized_sentence.tokens:
+                if len(token.text) <= config.minimum_token_length:
+                    continue
+                key = (token.text, token.spacy_lexical_category)
+                yield subtitle, key, self.matched_tokens.get(key, token)
+
+    def iterate_occurrence_rows(self) -> Iterator[Dict[str, Any]]:
+        for subtitle, (text, pos), token in self.iterate_occurrences():
+            yield self.get_occurrence_row(
+                subtitle=subtitle, text=text, pos=pos, token=token
+            )
+
+    @staticmethod
+    def __get_records__(dataframe: Any) -> List[Dict[str, Any]]:
+        """The dataframe is None when there were no rows"""
+        if dataframe is None:
+            return []
+        return dataframe.to_dict(orient="records")
+
+    def write_reports(self, occurrence_rows: Optional[Iterable[Dict[str, Any]]] = None):
+        """Write the rows one by one in the configured format, the occurrences
+        default to the ones of the tokenized subtitles"""
+        if occurrence_rows is None:
+            occurrence_rows = self.iterate_occurrence_rows()
+        reports = [
+            (LEXEME_REPORT, self.__get_records__(self.lexeme_dataframe)),
+            (MATCH_ERROR_REPORT, self.__get_records__(self.match_error_dataframe)),
+            (OCCURRENCE_REPORT, occurrence_rows),
+        ]
+        for report, rows in reports:
+            write_report(
+                output_directory=self.output_directory, report=report, rows=rows
+            )
+
+    def get_segment(self) -> Segment:
+        return Segment.for_file(
+            filename=self.filename,
+            language_code=self.language_code,
+            spacy_model=self.spacy_model,
+        )
+
+    def add_to_corpus_index(self):
+        """Store the counts of the file in the corpus index
+        and write the corpus reports next to the ones of the file"""
+        corpus_index = get_corpus_index()
+        if corpus_index is None:
+            return
+        segment = self.get_segment()
+        segment.number_of_subtitles = len(self.tokenized_sentences)
+        segment.number_of_tokens = self.number_of_tokens_found
+        for _, (text, _), token in self.iterate_occurrences():
+            segment.add_occurrence(text=text, norm=token.norm_, forms=token.forms)
+        for row in self.__get_records__(self.lexeme_dataframe):
+            segment.add_lexeme_row(row=row)
+        corpus_index.add_segment(segment=segment)
+        corpus_index.write_reports(
+            language_code=self.language_code, output_directory=self.output_directory
+        )
+
+    @property
+    def tokens_with_match_error(self) -> List[LexSrtToken]:
+        tokens = []
+        for token in self.tokens_above_minimum_length:
+            if token.match_error:
+                tokens.append(token)
+        return tokens
@@ -0,0 +1,144 @@
+"""Persistent cache of form lookups shared by everything that matches tokens
+
+Results are keyed by (iso639, representation, lexical category) and the
+version of the subclass table, which decides which subclasses of the
+category match. Both matches (positive) and misses (negative) are stored,
+each with their own time to live. When the cache grows above the maximum
+number of entries the least recently used ones are evicted."""
+import json
+import logging
+import time
+from typing import ClassVar, Dict, Iterable, List, Optional, Tuple
+
+import config
+from models.metrics import cache_lookups
+from models.sqlite_store import EvictingSqliteStore, get_store
+from models.wikidata_tables import get_subclass_table_version
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS matches (
+    iso639 TEXT NOT NULL,
+    representation TEXT NOT NULL,
+    lexical_category TEXT NOT NULL,
+    subclass_table TEXT NOT NULL,
+    forms TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (iso639, representation, lexical_category, subclass_table)
+);
+CREATE INDEX IF NOT EXISTS matches_accessed ON matches (accessed);"""
+
+
+class MatchCache(EvictingSqliteStore):
+    positive_ttl: int = config.match_cache_positive_ttl
+    negative_ttl: int = config.match_cache_negative_ttl
+    max_entries: int = config.match_cache_max_entries
+    hits: int = 0
+    misses: int = 0
+
+    description: ClassVar[str] = "match cache"
+    table: ClassVar[str] = "matches"
+    sql_schema: ClassVar[str] = SCHEMA
+
+    def open(self):
+        super().open()
+        columns = [
+            row[1] for row in self.__connection__.execute("PRAGMA table_info(matches)")
+        ]
+        if "subclass_table" not in columns:
+            logger.info(f"Clearing the {self.description} written by an older version")
+            self.__connection__.executescript(f"DROP TABLE matches;\n{SCHEMA}")
+            self.__connection__.commit()
+            self._estimated_entries = 0
+
+    def __expired__(self, forms: List[str], created: float, now: float) -> bool:
+        ttl = self.positive_ttl if forms else self.negative_ttl
+        return now - created > ttl
+
+    def get(
+        self, iso639: str, representation: str, lexical_category: str
+    ) -> Optional[List[str]]:
+        """Returns None on a miss and a possibly empty list of form ids on a hit"""
+        return self.get_many(
+            iso639=iso639, pairs=[(representation, lexical_category)]
+        ).get((representation, lexical_category))
+
+    def get_many(
+        self, iso639: str, pairs: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], List[str]]:
+        """Returns the cached pairs, pairs that are missing or expired are left out"""
+        now = time.time()
+        subclass_table = get_subclass_table_version()
+        results = {}
+        with self._lock:
+            connection = self.__connection__
+            for representation, lexical_category in pairs:
+                row = connection.execute(
+                    "SELECT forms, created FROM matches WHERE iso639 = ? "
+                    "AND representation = ? AND lexical_category = ? "
+                    "AND subclass_table = ?",
+                    (iso639, representation, lexical_category, subclass_table),
+                ).fetchone()
+                if row is not None:
+                    forms = json.loads(row[0])
+                    if not self.__expired__(forms=forms, created=row[1], now=now):
+                        results[(representation, lexical_category)] = forms
+                        connection.execute(
+                            "UPDATE matches SET accessed = ? WHERE iso639 = ? "
+                            "AND representation = ? AND lexical_category = ? "
+                            "AND subclass_table = ?",
+                            (
+                                now,
+                                iso639,
+                                representation,
+                                lexical_category,
+                                subclass_table,
+                            ),
+                        )
+                        self.hits += 1
+                        cache_lookups.inc(cache="match", result="hit")
+                        continue
+                self.misses += 1
+                cache_lookups.inc(cache="match", result="miss")
+            connection.commit()
+        return results
+
+    def set(
+        self,
+        iso639: str,
+        representation: str,
+        lexical_category: str,
+        forms: List[str],
+    ):
+        self.set_many(
+            iso639=iso639, results={(representation, lexical_category): forms}
+        )
+
+    def set_many(self, iso639: str, results: Dict[Tuple[str, str], List[str]]):
+        now = time.time()
+        subclass_table = get_subclass_table_version()
+        with self._lock:
+            connection = self.__connection__
+            connection.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        iso639,
+                        representation,
+                        lexical_category,
+                        subclass_table,
+                        json.dumps(forms),
+                        now,
+                        now,
+                    )
+                    for (representation, lexical_category), forms in results.items()
+                ],
+            )
+            self.__evict__(connection=connection, inserted=len(results))
+            connection.commit()
+
+
+def get_match_cache() -> Optional[MatchCache]:
+    """The process-wide match cache or None if it is disabled in the config"""
+    return get_store(MatchCache, config.match_cache_path)
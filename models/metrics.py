@@ -0,0 +1,210 @@
+"""Process-wide counters and histograms rendered in the Prometheus text format
+
+The requests to WDQS and the Wikibase API are counted by the shared HTTP
+clients, so every query is included no matter which function issued it.
+Stage durations and cache lookups are recorded where they happen."""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple, Union
+
+from pydantic import BaseModel, PrivateAttr
+
+if TYPE_CHECKING:
+    from requests import Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = [
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+]
+
+
+def format_labels(label_names: List[str], label_values: Tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in zip(label_names, label_values)
+    )
+    return "{" + labels + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter(BaseModel):
+    name: str
+    documentation: str
+    label_names: List[str] = list()
+    values: Dict[Tuple[str, ...], float] = dict()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __label_values__(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self.__label_values__(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(self.__label_values__(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(
+                    f"{self.name}{format_labels(self.label_names, label_values)} "
+                    f"{format_value(value)}"
+                )
+        return lines
+
+
+class Histogram(BaseModel):
+    name: str
+    documentation: str
+    label_names: List[str] = list()
+    buckets: List[float] = DEFAULT_BUCKETS
+    # per label values: the count of every bucket, the sum and the total count
+    bucket_counts: Dict[Tuple[str, ...], List[int]] = dict()
+    sums: Dict[Tuple[str, ...], float] = dict()
+    counts: Dict[Tuple[str, ...], int] = dict()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __label_values__(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def observe(self, value: float, **labels: str):
+        key = self.__label_values__(labels)
+        with self._lock:
+            bucket_counts = self.bucket_counts.setdefault(key, [0] * len(self.buckets))
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[index] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        label_names = self.label_names + ["le"]
+        with self._lock:
+            for label_values, bucket_counts in sorted(self.bucket_counts.items()):
+                for upper_bound, count in zip(self.buckets, bucket_counts):
+                    labels = format_labels(
+                        label_names, label_values + (format_value(upper_bound),)
+                    )
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = format_labels(label_names, label_values + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {self.counts[label_values]}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(
+                    f"{self.name}_sum{labels} {format_value(self.sums[label_values])}"
+                )
+                lines.append(f"{self.name}_count{labels} {self.counts[label_values]}")
+        return lines
+
+
+class MetricsRegistry(BaseModel):
+    metrics: Dict[str, Union[Counter, Histogram]] = dict()
+
+    def counter(self, name: str, documentation: str, label_names: List[str]) -> Counter:
+        metric = Counter(
+            name=name, documentation=documentation, label_names=label_names
+        )
+        self.metrics[name] = metric
+        return metric
+
+    def histogram(
+        self, name: str, documentation: str, label_names: List[str]
+    ) -> Histogram:
+        metric = Histogram(
+            name=name, documentation=documentation, label_names=label_names
+        )
+        self.metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+stage_duration = metrics.histogram(
+    "lexsrt_stage_duration_seconds",
+    "Time spent in each stage of processing a sentence",
+    ["stage"],
+)
+sparql_queries = metrics.counter(
+    "lexsrt_sparql_queries_total",
+    "Requests sent to the SPARQL endpoint by HTTP status",
+    ["status"],
+)
+sparql_query_duration = metrics.histogram(
+    "lexsrt_sparql_query_duration_seconds",
+    "Time until the SPARQL endpoint answered",
+    [],
+)
+wikibase_api_requests = metrics.counter(
+    "lexsrt_wikibase_api_requests_total",
+    "Requests sent to the Wikibase API by HTTP status",
+    ["status"],
+)
+downloaded_bytes = metrics.counter(
+    "lexsrt_downloaded_bytes_total",
+    "Size of the response bodies by source",
+    ["source"],
+)
+cache_lookups = metrics.counter(
+    "lexsrt_cache_lookups_total",
+    "Lookups in the local caches by result",
+    ["cache", "result"],
+)
+
+
+def record_sparql_response(response: "Response"):
+    sparql_queries.inc(status=str(response.status_code))
+    sparql_query_duration.observe(response.elapsed.total_seconds())
+    downloaded_bytes.inc(len(response.content), source="sparql")
+
+
+def record_wikibase_api_response(response: "Response"):
+    wikibase_api_requests.inc(status=str(response.status_code))
+    downloaded_bytes.inc(len(response.content), source="wikibase_api")
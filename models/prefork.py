@@ -0,0 +1,149 @@
+"""Pre-fork server sharing the spaCy models between API workers
+
+The master process loads the models and the lookup tables once, binds the
+socket and then forks the uvicorn workers. The weights are never written
+after loading so the pages stay shared through copy-on-write. gc.freeze()
+moves everything loaded so far out of the collected generations, otherwise
+the first garbage collection in every worker would touch the headers of
+all those objects and unshare the pages.
+
+Nothing that opens connections or starts threads may run in the master:
+the caches, the HTTP clients and the HTTP archive are created lazily in
+each worker by the lifespan of the app."""
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+import config
+from models.spacy_model_registry import resident_memory, spacy_models
+
+logger = logging.getLogger(__name__)
+
+
+def shared_memory(pid: int) -> int:
+    """Shared resident memory of a process in bytes, 0 if unknown"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as file:
+            return sum(
+                int(line.split()[1]) * 1024
+                for line in file
+                if line.startswith(("Shared_Clean:", "Shared_Dirty:"))
+            )
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PreforkServer(BaseModel):
+    host: str = "127.0.0.1"
+    port: int = 8000
+    workers: int = config.prefork_workers
+    preload_spacy_models: List[str] = config.preload_spacy_models
+    # pid of every running worker
+    pids: Dict[int, int] = dict()
+    stopping: bool = False
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __load__(self):
+        """Everything loaded here is shared by the workers"""
+        from models.lexeme_index import get_lexeme_index
+        from models.wikidata_tables import get_iso639_table, get_subclass_table
+
+        spacy_models.preload(spacy_models=self.preload_spacy_models)
+        get_iso639_table()
+        get_subclass_table()
+        if config.lexeme_index_path:
+            get_lexeme_index(config.lexeme_index_path)
+        # the app and everything it imports
+        import api  # noqa: F401
+
+        gc.collect()
+        gc.freeze()
+        print(
+            f"Loaded {len(self.preload_spacy_models)} spaCy models, the master uses "
+            f"{resident_memory() // 2**20} MB"
+        )
+
+    def __bind__(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def __fork_worker__(self, sock: socket.socket, number: int):
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = number
+            return
+        # the worker
+        for signal_number in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+            signal.signal(signal_number, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            import uvicorn
+
+            from api import app
+
+            uvicorn.Server(uvicorn.Config(app, lifespan="on")).run(sockets=[sock])
+        except BaseException:
+            logger.exception(f"Worker {number} failed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def __stop__(self, *args):
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def start(self):
+        self.__load__()
+        sock = self.__bind__()
+        signal.signal(signal.SIGTERM, self.__stop__)
+        signal.signal(signal.SIGINT, self.__stop__)
+        signal.signal(signal.SIGUSR1, self.print_memory)
+        for number in range(self.workers):
+            self.__fork_worker__(sock=sock, number=number)
+        print(
+            f"Serving on http://{self.host}:{self.port} "
+            f"with {self.workers} workers: {', '.join(map(str, self.pids))}"
+        )
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            number = self.pids.pop(pid, None)
+            if number is None or self.stopping:
+                continue
+            logger.warning(
+                f"Worker {number} with pid {pid} exited with status {status}, "
+                "restarting"
+            )
+            # do not spin when a worker fails right away
+            time.sleep(1)
+            self.__fork_worker__(sock=sock, number=number)
+        sock.close()
+        print("Stopped all workers")
+
+    def print_memory(self, *args):
+        """Sent SIGUSR1 the master prints how much memory the workers share"""
+        for pid, number in self.pids.items():
+            print(
+                f"Worker {number} ({pid}) shares "
+                f"{shared_memory(pid=pid) // 2**20} MB with the other processes"
+            )
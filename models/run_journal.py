@@ -0,0 +1,156 @@
+"""Write-ahead journal of the lookups completed during a CLI run
+
+Every chunk of matched tokens and fetched lexemes is appended to a JSON
+Lines file and flushed to disk as soon as it finishes. When a run is
+interrupted by a WDQS timeout or Ctrl-C the journal stays behind and
+--resume restores the recorded matches and lexemes instead of looking
+them up again. The first line describes the run so a journal is never
+applied to another file, language or model. The journal is removed
+when the run completes."""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from pydantic import BaseModel
+
+import config
+from models.corpus_index import file_sha256
+from models.exceptions import JournalError
+from models.token import LexSrtToken
+
+logger = logging.getLogger(__name__)
+
+RUN = "run"
+MATCH = "match"
+LEXEME = "lexeme"
+
+
+class RunJournal(BaseModel):
+    path: str
+    # describes the run, compared on resume
+    run: Dict[str, Any]
+    file: Optional[TextIO] = None
+    # recorded by the previous run, (text, PoS) to forms and match error
+    matches: Dict[Tuple[str, str], Tuple[List[str], bool]] = dict()
+    # recorded by the previous run, lexeme id to entity JSON
+    lexemes: Dict[str, Dict[str, Any]] = dict()
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def for_run(
+        cls, output_directory: str, filename: str, language_code: str, spacy_model: str
+    ) -> "RunJournal":
+        return cls(
+            path=os.path.join(output_directory, config.journal_filename),
+            run={
+                "type": RUN,
+                "filename": os.path.abspath(filename),
+                "sha256": file_sha256(filename),
+                "language_code": language_code,
+                "spacy_model": spacy_model,
+                "minimum_token_length": config.minimum_token_length,
+                "lexeme_index_path": config.lexeme_index_path,
+            },
+        )
+
+    def __load__(self) -> bool:
+        """False if the journal holds no complete line"""
+        with open(self.path, "rb+") as file:
+            content = file.read()
+            complete = content[: content.rfind(b"\n") + 1]
+            if len(complete) < len(content):
+                # the last line is cut off when the process was killed while
+                # writing, it is removed so the next record starts on its own line
+                logger.warning(f"Removing the incomplete last line of {self.path}")
+                file.truncate(len(complete))
+        lines = complete.decode("utf-8").splitlines()
+        if not lines:
+            return False
+        if json.loads(lines[0]) != self.run:
+            raise JournalError(
+                f"The journal {self.path} was written by another run, "
+                f"remove it or run without --resume"
+            )
+        for line in lines[1:]:
+            record = json.loads(line)
+            if record["type"] == MATCH:
+                self.matches[(record["text"], record["pos"])] = (
+                    record["forms"],
+                    record["match_error"],
+                )
+            elif record["type"] == LEXEME:
+                self.lexemes[record["id"]] = record["json"]
+        print(
+            f"Resuming from {self.path} with {len(self.matches)} matched tokens "
+            f"and {len(self.lexemes)} fetched lexemes"
+        )
+        return True
+
+    def open(self, resume: bool):
+        """Continue the journal when resuming, otherwise start a new one"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if resume and os.path.exists(self.path) and self.__load__():
+            self.file = open(self.path, "a", encoding="utf-8")
+            return
+        if resume:
+            print(f"No journal found at {self.path}, starting from the beginning")
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.__append__(records=[self.run])
+
+    def __append__(self, records: List[Dict[str, Any]]):
+        if self.file is None:
+            raise ValueError("The journal has not been opened")
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def restore_match(self, key: Tuple[str, str], token: LexSrtToken) -> bool:
+        """Give the token the recorded forms, False if it was not matched before"""
+        if key not in self.matches:
+            return False
+        forms, match_error = self.matches[key]
+        token.forms = list(forms)
+        token.match_error = match_error
+        return True
+
+    def record_matches(self, matched_tokens: Dict[Tuple[str, str], LexSrtToken]):
+        """The keys are the text and PoS before matching"""
+        self.__append__(
+            records=[
+                {
+                    "type": MATCH,
+                    "text": text,
+                    "pos": pos,
+                    "forms": token.forms,
+                    "match_error": token.match_error,
+                }
+                for (text, pos), token in matched_tokens.items()
+            ]
+        )
+
+    def record_lexemes(self, lexemes: List[Any]):
+        # get_json() leaves out the revision that from_json() needs
+        self.__append__(
+            records=[
+                {
+                    "type": LEXEME,
+                    "id": lexeme.id,
+                    "json": {**lexeme.get_json(), "lastrevid": lexeme.lastrevid},
+                }
+                for lexeme in lexemes
+            ]
+        )
+
+    def close(self, completed: bool):
+        """A completed run needs no journal"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if completed and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,106 @@
+"""Process-wide registry of loaded spaCy models
+
+Loading a model takes seconds and large models use hundreds of MB so
+every model is loaded once per process and the Language object is reused.
+When the memory used by the loaded models exceeds the budget the least
+recently used models are evicted. spaCy itself is imported with the first
+model so processes that never tokenize do not pay for it."""
+import gc
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, OrderedDict
+
+from pydantic import BaseModel, PrivateAttr
+
+import config
+from models.metrics import stage_duration
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+logger = logging.getLogger(__name__)
+
+
+def resident_memory() -> int:
+    """Resident set size of this process in bytes, 0 if unknown"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class SpacyModelRegistry(BaseModel):
+    memory_budget_mb: int = config.spacy_memory_budget_mb
+    # the Language objects
+    models: OrderedDict[str, Any] = OrderedDict()
+    # approximate memory used by each model, measured when loading it
+    memory_by_model: Dict[str, int] = dict()
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    # held while a model is loaded outside of _lock, one load at a time keeps
+    # the resident memory measured around it from counting other loads
+    _loading_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def used_memory(self) -> int:
+        return sum(self.memory_by_model.values())
+
+    def get(self, spacy_model: str) -> "Language":
+        with self._lock:
+            if spacy_model in self.models:
+                self.models.move_to_end(spacy_model)
+                return self.models[spacy_model]
+        # requests for models that are already loaded do not wait for this
+        with self._loading_lock:
+            with self._lock:
+                if spacy_model in self.models:
+                    self.models.move_to_end(spacy_model)
+                    return self.models[spacy_model]
+            print(f"Loading spaCy model {spacy_model}")
+            memory_before = resident_memory()
+            with stage_duration.time(stage="load_model"):
+                import spacy
+
+                nlp = spacy.load(spacy_model)
+            memory_used = max(resident_memory() - memory_before, 0)
+            with self._lock:
+                self.models[spacy_model] = nlp
+                self.memory_by_model[spacy_model] = memory_used
+                self.__evict__(keep=spacy_model)
+            logger.info(
+                f"Loaded spaCy model {spacy_model} using about "
+                f"{memory_used // 2**20} MB"
+            )
+            return nlp
+
+    def preload(self, spacy_models: List[str]):
+        for spacy_model in spacy_models:
+            self.get(spacy_model=spacy_model)
+
+    def __evict__(self, keep: str):
+        budget = self.memory_budget_mb * 2**20
+        while self.used_memory > budget and len(self.models) > 1:
+            spacy_model = next(iter(self.models))
+            if spacy_model == keep:
+                break
+            logger.info(f"Evicting spaCy model {spacy_model} to stay within the budget")
+            del self.models[spacy_model]
+            del self.memory_by_model[spacy_model]
+            gc.collect()
+
+
+spacy_models = SpacyModelRegistry()
+
+
+def unused_components(nlp: "Language") -> List[str]:
+    """The pipeline components in config.spacy_disabled_components
+    that this model actually has"""
+    return [
+        component
+        for component in config.spacy_disabled_components
+        if component in nlp.pipe_names
+    ]
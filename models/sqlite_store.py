@@ -0,0 +1,111 @@
+"""Shared base of the SQLite stores
+
+The match cache, token cache, lexeme store, HTTP archive and corpus index
+each keep one SQLite connection per process. The API uses them from worker
+threads, so the connection is opened with check_same_thread=False and all
+access goes through the lock of the store. Several processes may write
+the same file, e.g. the corpus workers sharing the token cache. WAL lets
+them read concurrently and a writer waits for the others up to the busy
+timeout instead of failing with "database is locked".
+
+The caches evict their least recently used entries above a maximum number
+of entries. The entries are counted once when the cache is opened and
+estimated from the writes after that, so writes do not scan the table."""
+import logging
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import ClassVar, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+Store = TypeVar("Store", bound="SqliteStore")
+
+
+class SqliteStore(BaseModel):
+    path: str
+    connection: Optional[sqlite3.Connection] = None
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    # name of the store in messages
+    description: ClassVar[str] = "SQLite store"
+    pragmas: ClassVar[List[str]] = ["journal_mode=WAL"]
+    # seconds a write waits for the lock held by another connection
+    busy_timeout: ClassVar[float] = 60.0
+    # run with executescript when the store is opened
+    sql_schema: ClassVar[str] = ""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.path, timeout=self.busy_timeout, check_same_thread=False
+        )
+        for pragma in self.pragmas:
+            self.connection.execute(f"PRAGMA {pragma}")
+        self.connection.executescript(self.sql_schema)
+        self.connection.commit()
+        logger.info(f"Opened {self.description} {self.path}")
+
+    @property
+    def __connection__(self) -> sqlite3.Connection:
+        if self.connection is None:
+            raise ValueError(f"The {self.description} has not been opened")
+        return self.connection
+
+
+class EvictingSqliteStore(SqliteStore):
+    """Store with an accessed column in the table that is evicted from"""
+
+    max_entries: int
+    # upper bound of the number of entries, replaced rows are counted as new
+    _estimated_entries: int = PrivateAttr(default=0)
+
+    table: ClassVar[str]
+
+    def open(self):
+        super().open()
+        (self._estimated_entries,) = self.__connection__.execute(
+            f"SELECT COUNT(*) FROM {self.table}"
+        ).fetchone()
+
+    def __evict__(self, connection: sqlite3.Connection, inserted: int):
+        """Only counts the entries when the estimate exceeds the maximum and
+        then evicts a tenth more than needed so this does not happen again
+        on the next write"""
+        self._estimated_entries += inserted
+        if self._estimated_entries <= self.max_entries:
+            return
+        (count,) = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            excess = count - self.max_entries + self.max_entries // 10
+            logger.debug(f"Evicting {excess} {self.description} entries")
+            connection.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN "
+                f"(SELECT rowid FROM {self.table} ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            count -= excess
+        self._estimated_entries = count
+
+
+@lru_cache(maxsize=32)
+def open_store(store_class: Type[Store], path: str) -> Store:
+    """Every store is opened once per process and path"""
+    store = store_class(path=path)
+    store.open()
+    return store
+
+
+def get_store(store_class: Type[Store], path: str) -> Optional[Store]:
+    """The process-wide store or None if the path in the config is empty"""
+    if not path:
+        return None
+    return open_store(store_class, os.path.expanduser(path))
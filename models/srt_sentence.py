@@ -1,14 +1,16 @@
+import asyncio
 import logging
 from typing import List
 
-import spacy
-from bs4 import BeautifulSoup
-from email_validator import EmailNotValidError, validate_email
 from pydantic import BaseModel
-from spacy.tokens import Token
 
 import config
-from models import LexSrtToken
+from models.async_lookup import match_tokens_against_forms_in_wikidata_async
+from models.cleaning import clean_sentence, valid_email
+from models.metrics import stage_duration
+from models.spacy_model_registry import spacy_models
+from models.token import LexSrtToken, match_tokens_against_forms_in_wikidata
+from models.token_cache import CompactToken, tokenize
 from models.token_response import TokenResponse
 
 logger = logging.getLogger(__name__)
@@ -55,63 +57,48 @@ class SrtSentence(BaseModel):
                 count += 1
         return count
 
-    def __remove_html_tags__(self):
-        # This function removes HTML tags from the given text.
-        soup = BeautifulSoup(self.sentence, "html.parser")
-        return soup.get_text()
-
-    def __remove_hyphens_not_understood_by_spacy__(self):
-        return self.sentence.replace("--", "")
-
-    def __extract_clean_sentence__(self):
-        self.cleaned_sentence = self.sentence
-        self.cleaned_sentence = self.__remove_html_tags__()
-        self.cleaned_sentence = self.__remove_hyphens_not_understood_by_spacy__()
+    def extract_clean_sentence(self):
+        with stage_duration.time(stage="clean"):
+            self.cleaned_sentence = clean_sentence(self.sentence)
 
     @property
     def valid_email(self) -> bool:
-        try:
-            # Check that the email address is valid. Turn on check_deliverability
-            # for first-time validations like on account creation pages (but not
-            # login pages).
-            validate_email(self.sentence, check_deliverability=False)
-            return True
-        except EmailNotValidError:
-            return False
+        return valid_email(self.sentence)
 
     def __get_spacy_tokens__(self):
         logger.debug("get_spacy_tokens: running")
         print("Tokenizing all subtitle sentences")
-        # Load a SpaCy language model (e.g., English)
-        nlp = spacy.load(self.spacy_model)
+        nlp = spacy_models.get(spacy_model=self.spacy_model)
+
+        with stage_duration.time(stage="tokenize"):
+            (compact_tokens,) = tokenize(nlp=nlp, sentences=[self.cleaned_sentence])
+            self.set_tokens(compact_tokens=compact_tokens)
 
-        sentence = self.cleaned_sentence
-        doc = nlp(sentence)
-        tokens = [token for token in doc]
-        filtered_tokens = self.__filter_tokens__(tokens)
-        self.tokens = self.convert_to_lexsrttoken(filtered_tokens)
+    def set_tokens(self, compact_tokens: List[CompactToken]):
+        """Used directly when many sentences are tokenized together"""
+        self.tokens = [LexSrtToken(*token) for token in compact_tokens]
 
     def __match_forms_based_on_tokens__(self):
-        [token.match_against_forms_in_wikidata() for token in self.tokens]
+        with stage_duration.time(stage="match"):
+            match_tokens_against_forms_in_wikidata(tokens=self.tokens)
 
     def clean_get_tokens_and_extract_forms(self):
         """Helper method"""
-        self.__extract_clean_sentence__()
+        self.extract_clean_sentence()
         self.__get_spacy_tokens__()
         self.__match_forms_based_on_tokens__()
 
-    def __filter_tokens__(self, tokens):
-        """Filter the tokens to remove junk like emails"""
-        filtered_tokens = []
-        for token in tokens:
-            # Filter away emails
-            if not self.valid_email:
-                filtered_tokens.append(token)
-        return filtered_tokens
-
-    @staticmethod
-    def convert_to_lexsrttoken(tokens: List[Token]) -> List[LexSrtToken]:
-        return [LexSrtToken(spacy_token=token) for token in tokens]
+    def __clean_and_get_tokens__(self):
+        self.extract_clean_sentence()
+        self.__get_spacy_tokens__()
+
+    async def clean_get_tokens_and_extract_forms_async(self):
+        """Same as clean_get_tokens_and_extract_forms but without blocking
+        the event loop. spaCy runs in a worker thread and
+        the lookups use the async client"""
+        await asyncio.to_thread(self.__clean_and_get_tokens__)
+        with stage_duration.time(stage="match"):
+            await match_tokens_against_forms_in_wikidata_async(tokens=self.tokens)
 
     @property
     def get_token_responses(self) -> List[TokenResponse]:
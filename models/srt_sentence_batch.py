@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from srt import Subtitle, parse, timedelta_to_srt_timestamp  # type: ignore
+
+import config
+from models.async_lookup import match_tokens_against_forms_in_wikidata_async
+from models.cue_response import CueResponse
+from models.metrics import stage_duration
+from models.spacy_model_registry import spacy_models
+from models.srt_sentence import SrtSentence
+from models.token_cache import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class SrtSentenceBatch(BaseModel):
+    """Process many sentences or the cues of a whole SRT in one go
+
+    The sentences are tokenized together with nlp.pipe and the lookups
+    are deduplicated across the whole batch. Results are produced
+    window by window in cue order so clients get the first ones early."""
+
+    sentences: List[str] = list()
+    subtitles: List[Subtitle] = list()
+    spacy_model: str
+    window_size: int = config.api_stream_window
+    known_forms: Dict[Tuple[str, Tuple[str, str]], List[str]] = dict()
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def from_srt(cls, srt_content: str, spacy_model: str) -> "SrtSentenceBatch":
+        subtitles = list(parse(srt_content))
+        return cls(
+            sentences=[subtitle.content for subtitle in subtitles],
+            subtitles=subtitles,
+            spacy_model=spacy_model,
+        )
+
+    def __get_tokens__(self, srt_sentences: List[SrtSentence]):
+        nlp = spacy_models.get(spacy_model=self.spacy_model)
+        for srt_sentence in srt_sentences:
+            srt_sentence.extract_clean_sentence()
+        with stage_duration.time(stage="tokenize"):
+            tokenized = tokenize(
+                nlp=nlp,
+                sentences=[
+                    srt_sentence.cleaned_sentence for srt_sentence in srt_sentences
+                ],
+            )
+            for srt_sentence, compact_tokens in zip(srt_sentences, tokenized):
+                srt_sentence.set_tokens(compact_tokens=compact_tokens)
+
+    def __get_cue_response__(
+        self, index: int, srt_sentence: SrtSentence
+    ) -> CueResponse:
+        subtitle: Optional[Subtitle] = (
+            self.subtitles[index] if index < len(self.subtitles) else None
+        )
+        return CueResponse(
+            index=index,
+            sentence=srt_sentence.sentence,
+            data=srt_sentence.get_token_responses,
+            start=timedelta_to_srt_timestamp(subtitle.start) if subtitle else None,
+            end=timedelta_to_srt_timestamp(subtitle.end) if subtitle else None,
+        )
+
+    async def stream_cue_responses(self) -> AsyncIterator[CueResponse]:
+        for start in range(0, len(self.sentences), self.window_size):
+            end = start + self.window_size
+            srt_sentences = [
+                SrtSentence(sentence=sentence, spacy_model=self.spacy_model)
+                for sentence in self.sentences[start:end]
+            ]
+            await asyncio.to_thread(self.__get_tokens__, srt_sentences)
+            with stage_duration.time(stage="match"):
+                await match_tokens_against_forms_in_wikidata_async(
+                    tokens=[
+                        token
+                        for srt_sentence in srt_sentences
+                        for token in srt_sentence.tokens
+                    ],
+                    known_forms=self.known_forms,
+                )
+            for offset, srt_sentence in enumerate(srt_sentences):
+                yield self.__get_cue_response__(
+                    index=start + offset, srt_sentence=srt_sentence
+                )
+
+    async def stream_ndjson(self) -> AsyncIterator[str]:
+        async for cue_response in self.stream_cue_responses():
+            yield json.dumps(cue_response.model_dump()) + "\n"
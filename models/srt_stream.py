@@ -0,0 +1,65 @@
+"""Generators for processing very large SRT files with bounded memory
+
+The file is read one cue at a time and only a small lookahead window
+is buffered so the trailing commercial and credits can still be removed."""
+import logging
+from collections import deque
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, TypeVar
+
+from srt import Subtitle, parse  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# remove_commercial_and_credits never looks further back than this
+CREDITS_LOOKAHEAD = 4
+
+
+def remove_commercial_and_credits(contents: List[str]) -> List[str]:
+    """Remove the trailing commercial and credits from the cue contents"""
+    # remove commercial
+    contents = contents[:-1]
+
+    # remove credits
+    if "subtitles" in str(contents[-1:]).lower():
+        contents = contents[:-1]
+
+    if "subtitles" in str(contents[-2:-1]).lower():
+        contents = contents[:-2]
+    return contents
+
+
+def iterate_subtitles(filename: str, encoding: str = "utf-8") -> Iterator[Subtitle]:
+    """Read the file line by line and parse one cue at a time"""
+    block: List[str] = []
+    with open(filename, encoding=encoding) as file:
+        for line in file:
+            if line.strip():
+                block.append(line)
+            elif block:
+                yield from parse("".join(block), ignore_errors=True)
+                block = []
+        if block:
+            yield from parse("".join(block), ignore_errors=True)
+
+
+def iterate_without_commercial_and_credits(
+    subtitles: Iterable[Subtitle],
+) -> Iterator[Subtitle]:
+    """Same result as remove_commercial_and_credits
+    but only buffers the last few cues"""
+    tail: Deque[Subtitle] = deque()
+    for subtitle in subtitles:
+        tail.append(subtitle)
+        if len(tail) > CREDITS_LOOKAHEAD:
+            yield tail.popleft()
+    kept = remove_commercial_and_credits([subtitle.content for subtitle in tail])
+    yield from islice(tail, len(kept))
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -1,23 +1,60 @@
 import logging
+import sys
 import urllib
-from typing import List
-
-from pydantic import BaseModel
-from spacy.tokens import Token
-
-from models.from_ordia import spacy_token_to_forms
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import config
+from models.from_ordia import (
+    clean_representation,
+    lexical_category_cascade,
+    lookup_forms_batch,
+)
 from models.token_response import TokenResponse
 
+if TYPE_CHECKING:
+    from spacy.tokens import Token
+
 logger = logging.getLogger(__name__)
 
 
-class LexSrtToken(BaseModel):
-    spacy_token: Token
-    forms: List[str] = list()
-    match_error: bool = False
+class LexSrtToken:
+    """Compact record of a token, only the attributes needed for matching
+    are copied from spaCy so the Doc can be freed right after tokenization
+
+    The attribute names mirror the spaCy Token so the functions from
+    Ordia work on both. The PoS and language are interned because they
+    repeat for almost every token."""
+
+    __slots__ = ("text", "norm_", "pos_", "lang_", "forms", "match_error")
+
+    def __init__(
+        self,
+        text: str,
+        norm_: str,
+        pos_: str,
+        lang_: str,
+        forms: Optional[List[str]] = None,
+        match_error: bool = False,
+    ):
+        self.text = text
+        self.norm_ = norm_
+        self.pos_ = sys.intern(pos_)
+        self.lang_ = sys.intern(lang_)
+        self.forms: List[str] = forms if forms is not None else list()
+        self.match_error = match_error
+
+    @classmethod
+    def from_spacy_token(cls, token: "Token") -> "LexSrtToken":
+        return cls(
+            text=token.text, norm_=token.norm_, pos_=token.pos_, lang_=token.lang_
+        )
 
-    class Config:
-        arbitrary_types_allowed = True
+    def __repr__(self) -> str:
+        return (
+            f"LexSrtToken(text={self.text!r}, pos_={self.pos_!r}, "
+            f"forms={self.forms!r}, match_error={self.match_error!r})"
+        )
 
     def __eq__(self, other):
         """Equal is when the text and PoS from spaCy is the same"""
@@ -32,118 +69,28 @@ class LexSrtToken(BaseModel):
         return hash_
 
     @property
-    def text(self) -> str:
-        return self.spacy_token.text
+    def spacy_lexical_category(self) -> str:
+        return self.pos_
 
     @property
-    def spacy_lexical_category(self):
-        return self.spacy_token.pos_
-
-    def match_against_forms_in_wikidata(self) -> None:
-        logger.debug("match_against_forms_in_wikidata: running")
-        print("Matching tokes against lexeme forms in Wikidata")
-        match = self.match(token=self.spacy_token)
-        if not match:
-            match = self.match_proper_noun_as_noun(token=self.spacy_token)
-        if not match:
-            match = self.match_proper_noun_as_adjective(token=self.spacy_token)
-        if not match:
-            match = self.match_as_noun(token=self.spacy_token)
-        if not match:
-            match = self.match_as_verb(token=self.spacy_token)
-        if not match:
-            match = self.match_as_adjective(token=self.spacy_token)
-        if not match:
-            quoted_token_representation = urllib.parse.quote(
-                self.spacy_token.norm_.lower()
-            )
-            # raise MatchError(f"See https://ordia.toolforge.org/search?q={token.norm_.lower()}")
-            logger.error(
-                f"MatchError: See https://ordia.toolforge.org/search?q={quoted_token_representation}"
-            )
-            self.match_error = True
-        print(f"Found {len(self.forms)} lexemes based on the tokens")
-
-    def match(self, token: Token) -> bool:
-        logger.info(
-            f"Trying to match '{token.text}' using the spaCy lexical category "
-            f"{token.pos_} with lexeme forms in Wikidata"
-        )
-        forms = spacy_token_to_forms(token=token)
-        if forms:
-            logger.info(f"Match(es) found {forms}")
-            self.forms.extend(forms)
-            return True
-        else:
-            return False
-
-    def match_proper_noun_as_noun(self, token: Token):
-        logger.info(
-            f"Trying to match '{token.text}' in as noun with lexemes " f"in Wikidata"
-        )
-        forms = spacy_token_to_forms(token=token, lookup_proper_noun_as_noun=True)
-        if forms:
-            logger.info(
-                f"Match(es) found {forms} after forcing the lexical category to noun"
-            )
-            self.forms.extend(forms)
-            return True
-        else:
-            return False
-
-    def match_proper_noun_as_adjective(self, token: Token):
-        logger.info(
-            f"Trying to match '{token.text}' as adjective with lexemes " f"in Wikidata"
-        )
-        forms = spacy_token_to_forms(token=token, lookup_proper_noun_as_adjective=True)
-        if forms:
-            logger.info(f"Match(es) found {forms} after lowercasing")
-            self.forms.extend(forms)
-            return True
-        else:
-            return False
+    def iso639(self) -> str:
+        return self.lang_
 
-    def match_as_noun(self, token: Token):
-        logger.info(
-            f"Trying to match '{token.text}' as noun with lexemes " f"in Wikidata"
-        )
-        forms = spacy_token_to_forms(token=token, overwrite_as_noun=True)
-        if forms:
-            logger.info(
-                f"Match(es) found {forms} after forcing the lexical category to noun"
-            )
-            self.forms.extend(forms)
-            return True
-        else:
-            return False
+    @property
+    def representation(self) -> str:
+        return clean_representation(self.norm_)
 
-    def match_as_verb(self, token: Token):
-        logger.info(
-            f"Trying to match '{token.text}' as verb with lexemes " f"in Wikidata"
+    @property
+    def lexical_category_cascade(self) -> List[str]:
+        return lexical_category_cascade(self.spacy_lexical_category)
+
+    def set_match_error(self):
+        quoted_token_representation = urllib.parse.quote(self.norm_.lower())
+        # raise MatchError(f"See https://ordia.toolforge.org/search?q={token.norm_.lower()}")
+        logger.error(
+            f"MatchError: See https://ordia.toolforge.org/search?q={quoted_token_representation}"
         )
-        forms = spacy_token_to_forms(token=token, overwrite_as_verb=True)
-        if forms:
-            logger.info(
-                f"Match(es) found {forms} after forcing the lexical category to verb"
-            )
-            self.forms.extend(forms)
-            return True
-        else:
-            return False
-
-    def match_as_adjective(self, token: Token):
-        logger.info(
-            f"Trying to match '{token.text}' as adjective with lexemes " f"in Wikidata"
-        )
-        forms = spacy_token_to_forms(token=token, overwrite_as_adjective=True)
-        if forms:
-            logger.info(
-                f"Match(es) found {forms} after forcing the lexical category to verb"
-            )
-            self.forms.extend(forms)
-            return True
-        else:
-            return False
+        self.match_error = True
 
     @property
     def get_as_response(self) -> TokenResponse:
@@ -153,3 +100,95 @@ class LexSrtToken(BaseModel):
             matched_forms=self.forms  # this is a list because
             # there might be multiple matches
         )
+
+
+def get_cascade_rounds(cascades: List[List[str]]) -> List[List[int]]:
+    """The cascade steps resolved together in each round of batch lookups"""
+    longest_cascade = max((len(cascade) for cascade in cascades), default=0)
+    if config.single_query_matching:
+        return [list(range(longest_cascade))]
+    return [[step] for step in range(longest_cascade)]
+
+
+def get_round_pairs(
+    tokens: List[LexSrtToken],
+    cascades: List[List[str]],
+    unmatched: List[int],
+    steps: List[int],
+) -> Dict[str, List[Tuple[str, str]]]:
+    """The (representation, lexical category) pairs to look up per language"""
+    pairs_by_language: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    for index in unmatched:
+        token = tokens[index]
+        for step in steps:
+            if step < len(cascades[index]):
+                pairs_by_language[token.iso639].append(
+                    (token.representation, cascades[index][step])
+                )
+    return pairs_by_language
+
+
+def apply_round_results(
+    tokens: List[LexSrtToken],
+    cascades: List[List[str]],
+    unmatched: List[int],
+    steps: List[int],
+    results: Dict[Tuple[str, Tuple[str, str]], List[str]],
+) -> List[int]:
+    """Give each token the forms of its first matching
+    cascade step and return the tokens still unmatched"""
+    still_unmatched = []
+    for index in unmatched:
+        token = tokens[index]
+        forms: List[str] = []
+        for step in steps:
+            if step < len(cascades[index]):
+                forms = results[
+                    (token.iso639, (token.representation, cascades[index][step]))
+                ]
+                if forms:
+                    break
+        if forms:
+            logger.info(f"Match(es) found {forms} for '{token.text}'")
+            token.forms.extend(forms)
+        else:
+            still_unmatched.append(index)
+    return still_unmatched
+
+
+def set_match_errors(tokens: List[LexSrtToken], unmatched: List[int]):
+    for index in unmatched:
+        tokens[index].set_match_error()
+    print(
+        f"Matched {len(tokens) - len(unmatched)} of {len(tokens)} "
+        f"tokens against lexeme forms in Wikidata"
+    )
+
+
+def match_tokens_against_forms_in_wikidata(tokens: List[LexSrtToken]) -> None:
+    """Match the tokens against the lexeme forms in Wikidata
+
+    The fallback cascade is resolved for all still unmatched tokens
+    at once using lookup_forms_batch, so the number of queries no longer
+    grows with the number of tokens. With config.single_query_matching
+    all cascade steps are sent in one round and the first match is picked
+    in process. The tokens are not mutated."""
+    logger.debug("match_tokens_against_forms_in_wikidata: running")
+    cascades = [token.lexical_category_cascade for token in tokens]
+    unmatched = list(range(len(tokens)))
+    for steps in get_cascade_rounds(cascades=cascades):
+        pairs_by_language = get_round_pairs(
+            tokens=tokens, cascades=cascades, unmatched=unmatched, steps=steps
+        )
+        results: Dict[Tuple[str, Tuple[str, str]], List[str]] = {}
+        for iso639, pairs in pairs_by_language.items():
+            for pair, forms in lookup_forms_batch(iso639=iso639, pairs=pairs).items():
+                results[(iso639, pair)] = forms
+        unmatched = apply_round_results(
+            tokens=tokens,
+            cascades=cascades,
+            unmatched=unmatched,
+            steps=steps,
+            results=results,
+        )
+    set_match_errors(tokens=tokens, unmatched=unmatched)
@@ -0,0 +1,144 @@
+"""Persistent cache of tokenization results
+
+spaCy is the slowest stage and subtitles repeat the same lines a lot, both
+within a film and between runs. Every cleaned cue is tokenized once per
+model and only the attributes the matcher needs are stored. The key is a
+hash of the text together with the model name, model version, spaCy version
+and the disabled components, so a new model never returns stale tokens."""
+import hashlib
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, ClassVar, Dict, Iterable, List, Optional, Tuple
+
+import config
+from models.cleaning import filter_tokens
+from models.metrics import cache_lookups
+from models.spacy_model_registry import unused_components
+from models.sqlite_store import EvictingSqliteStore, get_store
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+logger = logging.getLogger(__name__)
+
+# text, norm, PoS and language of a token
+CompactToken = Tuple[str, str, str, str]
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS tokens (
+    key TEXT PRIMARY KEY,
+    tokens TEXT NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_accessed ON tokens (accessed);"""
+
+
+class TokenCache(EvictingSqliteStore):
+    max_entries: int = config.token_cache_max_entries
+    hits: int = 0
+    misses: int = 0
+
+    description: ClassVar[str] = "token cache"
+    table: ClassVar[str] = "tokens"
+    sql_schema: ClassVar[str] = SCHEMA
+
+    @staticmethod
+    def key(model_key: str, text: str) -> str:
+        return hashlib.sha256(f"{model_key}\0{text}".encode()).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[CompactToken]]:
+        """Returns the cached keys, missing keys are left out"""
+        now = time.time()
+        results = {}
+        with self._lock:
+            connection = self.__connection__
+            for key in keys:
+                row = connection.execute(
+                    "SELECT tokens FROM tokens WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    cache_lookups.inc(cache="token", result="miss")
+                    continue
+                results[key] = [tuple(token) for token in json.loads(row[0])]
+                connection.execute(
+                    "UPDATE tokens SET accessed = ? WHERE key = ?", (now, key)
+                )
+                self.hits += 1
+                cache_lookups.inc(cache="token", result="hit")
+            connection.commit()
+        return results
+
+    def set_many(self, results: Dict[str, List[CompactToken]]):
+        now = time.time()
+        with self._lock:
+            connection = self.__connection__
+            connection.executemany(
+                "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)",
+                [
+                    (key, json.dumps(tokens, ensure_ascii=False), now)
+                    for key, tokens in results.items()
+                ],
+            )
+            self.__evict__(connection=connection, inserted=len(results))
+            connection.commit()
+
+
+def get_token_cache() -> Optional[TokenCache]:
+    """The process-wide token cache or None if it is disabled in the config"""
+    return get_store(TokenCache, config.token_cache_path)
+
+
+def get_model_key(nlp: "Language") -> str:
+    """Everything that changes the tokens of a model"""
+    import spacy
+
+    return "{lang}_{name}-{version} spacy-{spacy_version} without {disabled}".format(
+        lang=nlp.meta.get("lang", ""),
+        name=nlp.meta.get("name", ""),
+        version=nlp.meta.get("version", ""),
+        spacy_version=spacy.__version__,
+        disabled=",".join(unused_components(nlp=nlp)),
+    )
+
+
+def tokenize(
+    nlp: "Language",
+    sentences: List[str],
+    batch_size: int = config.spacy_batch_size,
+    n_process: int = 1,
+) -> List[List[CompactToken]]:
+    """The filtered tokens of every cleaned sentence in order
+
+    Each distinct sentence goes through spaCy at most once and
+    not at all if it is in the token cache"""
+    token_cache = get_token_cache()
+    model_key = get_model_key(nlp=nlp)
+    keys = [
+        TokenCache.key(model_key=model_key, text=sentence) for sentence in sentences
+    ]
+    unique_sentences = dict(zip(keys, sentences))
+    known = token_cache.get_many(keys=unique_sentences) if token_cache else {}
+    missing = [key for key in unique_sentences if key not in known]
+    if missing:
+        logger.info(
+            f"Tokenizing {len(missing)} of {len(sentences)} sentences, "
+            f"the rest are repeated or cached"
+        )
+        docs = nlp.pipe(
+            [unique_sentences[key] for key in missing],
+            batch_size=batch_size,
+            n_process=n_process,
+            disable=unused_components(nlp=nlp),
+        )
+        tokenized = {
+            key: [
+                (token.text, token.norm_, token.pos_, token.lang_)
+                for token in filter_tokens(doc)
+            ]
+            for key, doc in zip(missing, docs)
+        }
+        if token_cache:
+            token_cache.set_many(results=tokenized)
+        known.update(tokenized)
+    return [known[key] for key in keys]
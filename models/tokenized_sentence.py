@@ -1,12 +1,10 @@
 import logging
-from typing import List
+from typing import Any, List
 
 from pydantic import BaseModel
-from wikibaseintegrator import WikibaseIntegrator  # type: ignore
-from wikibaseintegrator.entities import LexemeEntity  # type: ignore
 
 import config
-from models import LexSrtToken
+from models.token import LexSrtToken
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +12,8 @@ logger = logging.getLogger(__name__)
 class TokenizedSentence(BaseModel):
     sentence: str = ""
     tokens: List[LexSrtToken] = list()
-    lexemes: List[LexemeEntity] = list()
-    wbi: WikibaseIntegrator = WikibaseIntegrator()
+    # LexemeEntity
+    lexemes: List[Any] = list()
 
     class Config:
         arbitrary_types_allowed = True
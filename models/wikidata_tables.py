@@ -0,0 +1,150 @@
+"""Precomputed Wikidata tables that spare runtime lookups
+
+iso639_to_q.json maps ISO 639 codes to language items so no query is
+needed to find the language. The shipped file is a curated list of the
+languages with a spaCy model, refresh_wikidata_tables.py replaces it with
+every ISO 639-1 and 639-2 code in Wikidata.
+
+lexical_category_subclasses.json maps every lexical category in POSTAG_TO_Q
+to the subclasses (including itself) that lexemes actually use. With it the
+form queries use a flat VALUES list instead of the expensive wdt:P279*
+property path. It is not shipped because only a table generated by
+refresh_wikidata_tables.py holds the full closure, without it and for
+categories missing from it the property path is used. Neither table is
+ever fetched or written at runtime. Results depending on the table are
+cached under its version so a refresh never returns stale misses."""
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from models.http_client import execute_sparql_query
+
+logger = logging.getLogger(__name__)
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+ISO639_TABLE_PATH = os.path.join(DATA_DIRECTORY, "iso639_to_q.json")
+SUBCLASS_TABLE_PATH = os.path.join(DATA_DIRECTORY, "lexical_category_subclasses.json")
+
+
+def load_table(path: str) -> Dict:
+    if not os.path.exists(path):
+        logger.info(f"No precomputed table {path}")
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_table(path: str, table: Dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(table, file, indent=1, sort_keys=True)
+        file.write("\n")
+
+
+@lru_cache(maxsize=1)
+def get_iso639_table() -> Dict[str, str]:
+    return load_table(ISO639_TABLE_PATH)
+
+
+@lru_cache(maxsize=1)
+def get_subclass_table() -> Dict[str, List[str]]:
+    return load_table(SUBCLASS_TABLE_PATH)
+
+
+@lru_cache(maxsize=1)
+def get_subclass_table_version() -> str:
+    """A short hash of the subclass table, empty when there is none"""
+    table = get_subclass_table()
+    if not table:
+        return ""
+    return hashlib.sha256(json.dumps(table, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def lexical_category_subclasses(lexical_category: str) -> Optional[List[str]]:
+    """The category and its subclasses or None if they are not known"""
+    return get_subclass_table().get(lexical_category)
+
+
+def build_lexical_category_values(lexical_categories: Iterable[str]) -> Optional[str]:
+    """A VALUES block binding every requested ?lexical_category to each
+    ?category in its subclass closure, None if any closure is unknown"""
+    rows: List[str] = []
+    for lexical_category in lexical_categories:
+        subclasses = lexical_category_subclasses(lexical_category)
+        if subclasses is None:
+            return None
+        rows.extend(f"(wd:{lexical_category} wd:{subclass})" for subclass in subclasses)
+    return "VALUES (?lexical_category ?category) {{ {rows} }}".format(
+        rows=" ".join(rows)
+    )
+
+
+def build_lexical_category_pattern(lexical_categories: Iterable[str]) -> str:
+    """The part of a form query restricting ?lexeme to the subclasses of
+    ?lexical_category, which has to be bound by the query itself"""
+    values = build_lexical_category_values(lexical_categories)
+    if values is None:
+        return "?lexeme wikibase:lexicalCategory / wdt:P279* ?lexical_category ."
+    return f"""{values}
+           ?lexeme wikibase:lexicalCategory ?category ."""
+
+
+def fetch_iso639_table() -> Dict[str, str]:
+    """All ISO 639-1 and 639-2 codes in Wikidata, the first item wins when
+    several items share a code"""
+    data = execute_sparql_query(
+        query="""
+       SELECT ?code ?language {
+           { ?language wdt:P218 ?code } UNION { ?language wdt:P219 ?code }
+       } ORDER BY ?code ?language"""
+    )
+    table: Dict[str, str] = {}
+    for binding in data["results"]["bindings"]:
+        table.setdefault(binding["code"]["value"], binding["language"]["value"][31:])
+    return table
+
+
+def fetch_subclass_table(lexical_categories: Iterable[str]) -> Dict[str, List[str]]:
+    """The subclass closure of every category limited to the
+    subclasses used as lexical category by at least one lexeme"""
+    unique_lexical_categories = list(dict.fromkeys(lexical_categories))
+    data = execute_sparql_query(
+        query="""
+       SELECT DISTINCT ?lexical_category ?subclass {{
+           VALUES ?lexical_category {{ {values} }}
+           ?subclass wdt:P279* ?lexical_category .
+           FILTER EXISTS {{ ?lexeme wikibase:lexicalCategory ?subclass }}
+       }}""".format(
+            values=" ".join(
+                f"wd:{lexical_category}"
+                for lexical_category in unique_lexical_categories
+            )
+        ),
+    )
+    table: Dict[str, List[str]] = {
+        lexical_category: [lexical_category]
+        for lexical_category in unique_lexical_categories
+    }
+    for binding in data["results"]["bindings"]:
+        lexical_category = binding["lexical_category"]["value"][31:]
+        subclass = binding["subclass"]["value"][31:]
+        if subclass not in table[lexical_category]:
+            table[lexical_category].append(subclass)
+    return {
+        lexical_category: sorted(subclasses)
+        for lexical_category, subclasses in table.items()
+    }
+
+
+def refresh_tables(lexical_categories: Iterable[str]):
+    print("Fetching the ISO 639 codes of all languages")
+    write_table(ISO639_TABLE_PATH, fetch_iso639_table())
+    print("Fetching the subclasses of the lexical categories")
+    write_table(SUBCLASS_TABLE_PATH, fetch_subclass_table(lexical_categories))
+    get_iso639_table.cache_clear()
+    get_subclass_table.cache_clear()
+    get_subclass_table_version.cache_clear()
+    print(f"Wrote {ISO639_TABLE_PATH} and {SUBCLASS_TABLE_PATH}")
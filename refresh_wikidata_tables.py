@@ -0,0 +1,22 @@
+"""
+Refresh the precomputed ISO 639 and lexical category subclass tables
+in models/data with one WDQS query each. Run it once after installing
+and again when new lexical categories are taken into use in Wikidata.
+"""
+import logging
+from argparse import ArgumentParser
+
+import config
+from models.from_ordia import POSTAG_TO_Q
+from models.wikidata_tables import refresh_tables
+
+logging.basicConfig(level=config.loglevel)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Refresh the precomputed language and lexical category tables."
+    )
+    parser.parse_args()
+    logger.info("Starting")
+    refresh_tables(lexical_categories=POSTAG_TO_Q.values())
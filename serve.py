@@ -0,0 +1,44 @@
+"""
+Serve the API with pre-forked workers sharing the spaCy models
+The models are loaded once in the master process before forking so
+the workers share them through copy-on-write, see models/prefork.py.
+Only works on systems with fork, e.g. Linux.
+"""
+import logging
+from argparse import ArgumentParser
+
+import config
+from models.prefork import PreforkServer
+
+logging.basicConfig(level=config.loglevel)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Serve the API with workers sharing the preloaded spaCy models."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=config.prefork_workers,
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "-m",
+        "--spacy_model",
+        action="append",
+        default=[],
+        help="spaCy model to preload, can be repeated, "
+        "defaults to preload_spacy_models in config.py",
+    )
+    args = parser.parse_args()
+    logger.info("Starting")
+    PreforkServer(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        preload_spacy_models=args.spacy_model or config.preload_spacy_models,
+    ).start()
@@ -0,0 +1,58 @@
+import spacy
+
+import config
+import models.lexsrt
+from models.lexsrt import LexSrt
+from models.spacy_model_registry import spacy_models
+from models.token_cache import get_token_cache
+
+SRT = """1
+00:00:01,000 --> 00:00:02,000
+Somewhere beyond the mountains
+
+2
+00:00:03,000 --> 00:00:04,000
+- Remember everything tomorrow
+
+3
+00:00:05,000 --> 00:00:06,000
+Somewhere beyond the mountains
+
+4
+00:00:07,000 --> 00:00:08,000
+Subtitles by somebody
+
+5
+00:00:09,000 --> 00:00:10,000
+Watch more on some website
+"""
+
+
+def test_second_stream_run_hits_the_token_cache(tmp_path, monkeypatch):
+    filename = tmp_path / "episode.srt"
+    filename.write_text(SRT, encoding="utf-8")
+    monkeypatch.setattr(config, "token_cache_path", str(tmp_path / "tokens.sqlite3"))
+    monkeypatch.setattr(config, "lexeme_store_path", "")
+    monkeypatch.setattr(config, "corpus_index_path", "")
+    monkeypatch.setitem(spacy_models.models, "blank_en", spacy.blank("en"))
+    monkeypatch.setitem(spacy_models.memory_by_model, "blank_en", 0)
+    # nothing is looked up in Wikidata
+    monkeypatch.setattr(
+        models.lexsrt, "match_tokens_against_forms_in_wikidata", lambda tokens: None
+    )
+    lexsrt = LexSrt(
+        filename=str(filename),
+        language_code="en",
+        spacy_model="blank_en",
+        output_directory=str(tmp_path / "output"),
+    )
+
+    lexsrt.process_as_stream()
+    token_cache = get_token_cache()
+    assert token_cache is not None
+    assert token_cache.misses == 2
+    assert token_cache.hits == 0
+
+    lexsrt.process_as_stream()
+    assert token_cache.misses == 2
+    assert token_cache.hits == 2